@@ -0,0 +1,25 @@
+"""
+Helpers shared by the *_benchmark.py scripts
+"""
+
+import os
+import tempfile
+from typing import List
+
+
+def use_throwaway_database():
+    """Point config at an empty database in a temporary directory
+
+    Call before importing config or database, which read the environment
+    (and open the database) at import time. Benchmarks then never touch
+    the live bot's data and can run next to it.
+    """
+    os.environ['DB_PATH'] = os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+    os.environ['GROUP_CHAT_ID'] = '0'
+    os.environ['STUDY_BUDDIES'] = ''
+
+
+def percentile(values: List[float], share: float) -> float:
+    """Get the value below which share (0-1) of the values fall"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
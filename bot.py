@@ -1,15 +1,34 @@
+import functools
 import logging
 from datetime import datetime, date
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from typing import Dict, List, Optional, Tuple
+from telegram import (
+    Update,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InlineQueryResultArticle,
+    InputTextMessageContent
+)
+from telegram.helpers import escape_markdown
 from telegram.ext import (
     Application,
     CommandHandler,
     CallbackQueryHandler,
     ContextTypes
 )
+import pytz
 import config
-from database import db
-from ielts_topics import get_current_topic, get_current_day_number, format_topic_message
+import callback_codec
+from callback_codec import Action, CallbackDecodeError
+from database import REMINDER_KINDS, adb, local_today, mask_to_status
+from broadcast import Broadcaster
+from edit_coalescer import EditCoalescer
+from outbox import Outbox
+from render_cache import RenderCache
+from ielts_topics import get_catalog, get_topic_for_day, resolve_plan_day
+from plan_packs import available_plans, get_plan
+from vocab_index import vocab_index
+from review import GRADE_LABELS, Grade, plan_cards
 
 # Configure logging
 logging.basicConfig(
@@ -18,26 +37,46 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Rate-limited fan-out of outgoing messages
+broadcaster = Broadcaster()
+
+# Persistent queue for reminders and edits that failed to send
+outbox = Outbox(broadcaster)
+
+# Debounces dashboard edits when several buttons are tapped in a row
+edit_coalescer = EditCoalescer(fallback=outbox.edit, cancel_fallback=outbox.cancel_edit)
+outbox.on_edit_sent = edit_coalescer.remember
+
+# Prebuilt message texts, keyboards and per-user button rows
+render_cache = RenderCache()
+
+# All tasks (morning + afternoon); callbacks refer to tasks by index here
+ALL_TASKS = config.MORNING_TASKS + config.AFTERNOON_TASKS
 
-def ensure_user_registered(user):
-    """Ensure user is registered in database"""
+
+async def ensure_user_registered(user, chat=None):
+    """Ensure user is registered in database and as a participant of the chat"""
     if user:
-        db.add_user(
+        await adb.add_user(
             user_id=user.id,
             first_name=user.first_name,
             last_name=user.last_name,
             username=user.username
         )
+    if chat:
+        await adb.add_chat(chat.id, chat.type, chat.title)
+        if user:
+            await adb.add_member(chat.id, user.id)
 
 
-def get_user_name(user_id: int) -> str:
+async def get_user_name(user_id: int) -> str:
     """Get user name by ID from database"""
-    return db.get_user_name(user_id)
+    return await adb.get_user_name(user_id)
 
 
-def get_writing_task() -> str:
+def get_writing_task(day: Optional[date] = None) -> str:
     """Get today's writing task based on schedule"""
-    today = date.today()
+    today = day or local_today()
     weekday = today.weekday()
     task = config.WRITING_SCHEDULE.get(weekday)
 
@@ -46,209 +85,256 @@ def get_writing_task() -> str:
     return "✍️ Writing (Отдых)"
 
 
-def create_task_keyboard_dual() -> InlineKeyboardMarkup:
-    """Create inline keyboard with two columns - one for each user"""
-    keyboard = []
-    all_users = db.get_all_users()
+def _state_key(participant: Dict) -> Tuple[int, int, Optional[int]]:
+    """Identify the rendered state of a participant
+
+    The member index is part of the key because callbacks embed it, and
+    it differs between chats.
+    """
+    return participant['user_id'], participant.get('version', 0), participant.get('member_index')
+
+
+def get_task_labels(day: date) -> Tuple[InlineKeyboardButton, ...]:
+    """Get the task label buttons for a day, one per task"""
+    def build():
+        labels = []
+        for task_index, (task_id, task_name) in enumerate(ALL_TASKS):
+            # Adjust writing task name
+            if task_id == 'writing':
+                task_name = get_writing_task(day)
+            labels.append(InlineKeyboardButton(
+                task_name,
+                callback_data=callback_codec.encode(Action.LABEL, task=task_index)
+            ))
+        return tuple(labels)
+
+    return render_cache.get(('labels', day), build)
+
+
+def toggle_callback(participant: Dict, task_index: int, page: int, day: date) -> str:
+    """Encode the callback data of a participant's task button"""
+    member_index = participant.get('member_index')
+    if member_index is None:
+        # Snapshots taken without a chat have no participant number
+        raise ValueError(f"User {participant['user_id']} has no member index in this chat")
+    return callback_codec.encode(
+        Action.TOGGLE,
+        member=member_index,
+        task=task_index,
+        page=page,
+        day=callback_codec.day_to_field(day)
+    )
 
-    # If less than 2 users, show single column
-    if len(all_users) < 2:
-        user_id = list(all_users.keys())[0] if all_users else 0
-        return create_task_keyboard_single(user_id)
 
-    # Get two users (Shakhnaz and Sultan)
-    user_ids = list(all_users.keys())[:2]
-    user1_id, user2_id = user_ids[0], user_ids[1]
+def get_user_buttons(participant: Dict, day: date, page: int = 0) -> Tuple[InlineKeyboardButton, ...]:
+    """Get a user's short-name toggle buttons, one per task"""
+    def build():
+        # Get short names (first name only)
+        short_name = participant['name'].split()[0]
+        buttons = []
+        for task_index, (task_id, _) in enumerate(ALL_TASKS):
+            status = "✅" if participant['status'].get(task_id, False) else "☐"
+            buttons.append(InlineKeyboardButton(
+                f"{status} {short_name}",
+                callback_data=toggle_callback(participant, task_index, page, day)
+            ))
+        return tuple(buttons)
 
-    user1_status = db.get_today_status(user1_id)
-    user2_status = db.get_today_status(user2_id)
+    return render_cache.get(('buttons', day, page, _state_key(participant)), build)
 
-    user1_name = get_user_name(user1_id)
-    user2_name = get_user_name(user2_id)
 
-    # Get short names (first name only)
-    user1_short = user1_name.split()[0]
-    user2_short = user2_name.split()[0]
+def get_page_navigation(page: int, page_count: int) -> List[InlineKeyboardButton]:
+    """Get the previous/current/next page row of the dashboard"""
+    return [
+        InlineKeyboardButton("◀️", callback_data=callback_codec.encode(Action.PAGE, page=(page - 1) % page_count)),
+        InlineKeyboardButton(f"{page + 1}/{page_count}", callback_data=callback_codec.encode(Action.PAGE, page=page)),
+        InlineKeyboardButton("▶️", callback_data=callback_codec.encode(Action.PAGE, page=(page + 1) % page_count))
+    ]
 
-    # All tasks (morning + afternoon)
-    all_tasks = list(config.MORNING_TASKS) + list(config.AFTERNOON_TASKS)
 
-    # Create two column layout
-    for task_id, task_name in all_tasks:
-        # Adjust writing task name
-        if task_id == 'writing':
-            task_name = get_writing_task()
+def create_dashboard_keyboard(page: Dict) -> InlineKeyboardMarkup:
+    """Create inline keyboard with one column per participant on the page"""
+    participants = page['participants']
 
-        # Get status for both users
-        status1 = "✅" if user1_status.get(task_id, False) else "☐"
-        status2 = "✅" if user2_status.get(task_id, False) else "☐"
+    # If less than 2 users, show single column
+    if page['total'] < 2:
+        participant = participants[0] if participants else {
+            'user_id': 0, 'status': {}, 'day': page['day'], 'member_index': 0
+        }
+        return create_task_keyboard_single(participant)
 
-        # Create two buttons side by side
-        button1 = InlineKeyboardButton(
-            f"{status1} {user1_short}",
-            callback_data=f"toggle_{user1_id}_{task_id}"
-        )
-        button2 = InlineKeyboardButton(
-            f"{status2} {user2_short}",
-            callback_data=f"toggle_{user2_id}_{task_id}"
-        )
+    today = page['day']
+    number, page_count = page['page'], page['page_count']
+
+    def build():
+        keyboard = []
+        labels = get_task_labels(today)
+        columns = [get_user_buttons(participant, today, number) for participant in participants]
+
+        # Task name as label row, then the page's users side by side
+        for task_index, label in enumerate(labels):
+            keyboard.append([label])
+            keyboard.append([buttons[task_index] for buttons in columns])
 
-        # Add task name as label row
-        keyboard.append([
-            InlineKeyboardButton(task_name, callback_data=f"task_label_{task_id}")
-        ])
-        # Add user buttons row
-        keyboard.append([button1, button2])
+        if page_count > 1:
+            keyboard.append(get_page_navigation(number, page_count))
 
-    return InlineKeyboardMarkup(keyboard)
+        return InlineKeyboardMarkup(keyboard)
 
+    key = ('dashboard', today, number, page_count, tuple(_state_key(p) for p in participants))
+    return render_cache.get(key, build)
 
-def create_task_keyboard_single(user_id: int) -> InlineKeyboardMarkup:
+
+def create_task_keyboard_single(participant: Dict) -> InlineKeyboardMarkup:
     """Create inline keyboard with all daily tasks for a specific user"""
-    keyboard = []
-    user_status = db.get_today_status(user_id)
+    today = participant['day']
 
-    # Morning tasks
-    for task_id, task_name in config.MORNING_TASKS:
-        status = "✅" if user_status.get(task_id, False) else "☐"
-        button_text = f"{status} {task_name}"
-        keyboard.append([InlineKeyboardButton(button_text, callback_data=f"toggle_{user_id}_{task_id}")])
+    def build():
+        keyboard = []
+        user_status = participant['status']
 
-    # Afternoon tasks
-    for task_id, task_name in config.AFTERNOON_TASKS:
-        if task_id == 'writing':
-            task_name = get_writing_task()
+        for task_index, label in enumerate(get_task_labels(today)):
+            task_id = ALL_TASKS[task_index][0]
+            status = "✅" if user_status.get(task_id, False) else "☐"
+            button_text = f"{status} {label.text}"
+            keyboard.append([InlineKeyboardButton(
+                button_text,
+                callback_data=toggle_callback(participant, task_index, 0, today)
+            )])
 
-        status = "✅" if user_status.get(task_id, False) else "☐"
-        button_text = f"{status} {task_name}"
-        keyboard.append([InlineKeyboardButton(button_text, callback_data=f"toggle_{user_id}_{task_id}")])
+        # Show all users progress button
+        keyboard.append([InlineKeyboardButton(
+            "👥 Прогресс всех",
+            callback_data=callback_codec.encode(Action.SHOW_ALL)
+        )])
 
-    # Show all users progress button
-    keyboard.append([InlineKeyboardButton("👥 Прогресс всех", callback_data="show_all")])
+        return InlineKeyboardMarkup(keyboard)
 
-    return InlineKeyboardMarkup(keyboard)
+    return render_cache.get(('single', today, _state_key(participant)), build)
 
 
-def format_dual_progress_message() -> str:
-    """Format progress message for both users"""
-    today = date.today()
-    all_users = db.get_all_users()
+def get_special_day(day: date) -> str:
+    """Get the Saturday/Sunday banner line for a day"""
+    if day.weekday() == 5:
+        return "\n🎯 **MOCK TEST DAY!**"
+    if day.weekday() == 6:
+        return "\n😌 **ЛЁГКИЙ РЕЖИМ**"
+    return ""
 
-    # Check if Saturday or Sunday
-    is_saturday = today.weekday() == 5
-    is_sunday = today.weekday() == 6
 
-    special_day = ""
-    if is_saturday:
-        special_day = "\n🎯 **MOCK TEST DAY!**"
-    elif is_sunday:
-        special_day = "\n😌 **ЛЁГКИЙ РЕЖИМ**"
+def format_dashboard_message(page: Dict) -> str:
+    """Format progress message for the participants on a dashboard page"""
+    participants = page['participants']
 
-    if len(all_users) < 2:
+    if page['total'] < 2:
         # Single user mode
-        if all_users:
-            user_id = list(all_users.keys())[0]
-            return format_user_progress_message(user_id)
+        if participants:
+            return format_user_progress_message(participants[0])
         return "📅 Начните использовать бота!"
 
-    # Get two users
-    user_ids = list(all_users.keys())[:2]
-    user1_id, user2_id = user_ids[0], user_ids[1]
-
-    user1_name = get_user_name(user1_id)
-    user2_name = get_user_name(user2_id)
+    today = page['day']
+    total = len(ALL_TASKS)
 
-    user1_status = db.get_today_status(user1_id)
-    user2_status = db.get_today_status(user2_id)
-
-    all_tasks = config.MORNING_TASKS + config.AFTERNOON_TASKS
-    total = len(all_tasks)
+    def build_line(participant: Dict) -> str:
+        return (
+            f"**{participant['name']}**: {participant['completed']}/{total} задач"
+            f" | 🔥 {participant['streak']} дней"
+        )
 
-    completed1 = sum(1 for task_id, _ in all_tasks if user1_status.get(task_id, False))
-    completed2 = sum(1 for task_id, _ in all_tasks if user2_status.get(task_id, False))
+    def build():
+        lines = "\n".join(
+            render_cache.get(('dashboard_line', today, _state_key(p)), lambda p=p: build_line(p))
+            for p in participants
+        )
 
-    streak1, best1 = db.get_streak(user1_id)
-    streak2, best2 = db.get_streak(user2_id)
+        page_line = ""
+        if page['page_count'] > 1:
+            first = page['page'] * config.DASHBOARD_PAGE_SIZE + 1
+            last = first + len(participants) - 1
+            page_line = f"\n\n👥 Участники {first}-{last} из {page['total']}"
 
-    message = f"""
-📅 **{today.strftime('%d.%m.%Y')}**{special_day}
+        return f"""
+📅 **{today.strftime('%d.%m.%Y')}**{get_special_day(today)}
 ─────────────────
 
-**{user1_name}**: {completed1}/{total} задач | 🔥 {streak1} дней
-**{user2_name}**: {completed2}/{total} задач | 🔥 {streak2} дней
+{lines}{page_line}
 
 Нажимайте на кнопки, чтобы отметить задачи:
 """
 
-    return message
+    key = ('dashboard_text', today, page['page'], page['total'],
+           tuple(_state_key(p) for p in participants))
+    return render_cache.get(key, build)
 
 
-def format_user_progress_message(user_id: int) -> str:
+def format_user_progress_message(participant: Dict) -> str:
     """Format progress message for a single user"""
-    today = date.today()
-    user_status = db.get_today_status(user_id)
-    user_name = get_user_name(user_id)
+    today = participant['day']
 
-    all_tasks = config.MORNING_TASKS + config.AFTERNOON_TASKS
-    completed = sum(1 for task_id, _ in all_tasks if user_status.get(task_id, False))
-    total = len(all_tasks)
-
-    current_streak, best_streak = db.get_streak(user_id)
-
-    # Check if Saturday or Sunday
-    is_saturday = today.weekday() == 5
-    is_sunday = today.weekday() == 6
+    def build():
+        total = len(config.MORNING_TASKS + config.AFTERNOON_TASKS)
 
-    special_day = ""
-    if is_saturday:
-        special_day = "\n🎯 **MOCK TEST DAY!**"
-    elif is_sunday:
-        special_day = "\n😌 **ЛЁГКИЙ РЕЖИМ**"
-
-    message = f"""
-📅 **{today.strftime('%d.%m.%Y')} - {user_name}**{special_day}
+        return f"""
+📅 **{today.strftime('%d.%m.%Y')} - {participant['name']}**{get_special_day(today)}
 ─────────────────
-Выполнено: {completed}/{total} задач
-🔥 Streak: {current_streak} дней (Лучший: {best_streak})
+Выполнено: {participant['completed']}/{total} задач
+🔥 Streak: {participant['streak']} дней (Лучший: {participant['best_streak']})
 
 Нажимайте на кнопки ниже, чтобы отметить задачи:
 """
 
-    return message
+    return render_cache.get(('user_text', today, _state_key(participant)), build)
 
 
-def format_all_users_summary() -> str:
+def format_all_users_summary(dashboard: List[Dict]) -> str:
     """Format summary of all users' progress"""
-    today = date.today()
-    all_users = db.get_all_users()
-
-    if not all_users:
+    if not dashboard:
         return "📊 Пока никто не начал работу с ботом"
 
-    summary = f"📊 **Общий прогресс - {today.strftime('%d.%m.%Y')}**\n\n"
+    today = dashboard[0]['day']
 
-    all_tasks = config.MORNING_TASKS + config.AFTERNOON_TASKS
-    total_tasks = len(all_tasks)
+    total_tasks = len(config.MORNING_TASKS + config.AFTERNOON_TASKS)
 
-    for user_id, user_name in all_users.items():
-        user_status = db.get_today_status(user_id)
-        completed = sum(1 for task_id, _ in all_tasks if user_status.get(task_id, False))
-        current_streak, _ = db.get_streak(user_id)
+    def build_entry(participant: Dict) -> str:
+        completed = participant['completed']
 
         # Progress bar
         progress = "█" * completed + "░" * (total_tasks - completed)
 
-        summary += f"**{user_name}**\n"
-        summary += f"├ {progress} {completed}/{total_tasks}\n"
-        summary += f"└ 🔥 {current_streak} дней\n\n"
+        return (
+            f"**{participant['name']}**\n"
+            f"├ {progress} {completed}/{total_tasks}\n"
+            f"└ 🔥 {participant['streak']} дней\n\n"
+        )
+
+    entries = [
+        render_cache.get(('summary_entry', today, _state_key(p)), lambda p=p: build_entry(p))
+        for p in dashboard
+    ]
+    return f"📊 **Общий прогресс - {today.strftime('%d.%m.%Y')}**\n\n" + "".join(entries)
+
+
+async def render_dashboard(chat_id: int, page: int = 0,
+                           snapshot: Optional[Dict] = None) -> Tuple[str, InlineKeyboardMarkup]:
+    """Render a page of a chat's dashboard: message text and keyboard
 
-    return summary
+    snapshot is a participant state returned by toggle_task; it is shown
+    for that participant's row unless the page already has a newer one.
+    """
+    dashboard = await adb.get_dashboard_page(chat_id, page, config.DASHBOARD_PAGE_SIZE)
+    if snapshot is not None and snapshot['day'] == dashboard['day']:
+        dashboard['participants'] = [
+            snapshot if participant['user_id'] == snapshot['user_id']
+            and snapshot['version'] >= participant['version'] else participant
+            for participant in dashboard['participants']
+        ]
+    return format_dashboard_message(dashboard), create_dashboard_keyboard(dashboard)
 
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command"""
     user = update.effective_user
-    ensure_user_registered(user)
+    await ensure_user_registered(user, update.effective_chat)
 
     welcome_text = f"""
 👋 Привет, {user.first_name}!
@@ -286,34 +372,36 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def today_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show today's progress"""
     user = update.effective_user
-    ensure_user_registered(user)
+    await ensure_user_registered(user, update.effective_chat)
 
-    # Use dual column keyboard for both users
-    message_text = format_dual_progress_message()
-    keyboard = create_task_keyboard_dual()
+    message_text, keyboard = await render_dashboard(update.effective_chat.id)
 
-    await update.message.reply_text(
+    message = await update.message.reply_text(
         text=message_text,
         reply_markup=keyboard,
         parse_mode='Markdown'
     )
+    edit_coalescer.remember(message.chat_id, message.message_id, message_text, keyboard)
 
 
 async def all_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Show all users' progress"""
-    summary = format_all_users_summary()
+    """Show the progress of all participants of the chat"""
+    await ensure_user_registered(update.effective_user, update.effective_chat)
+    summary = format_all_users_summary(await adb.get_dashboard(update.effective_chat.id))
     await update.message.reply_text(summary, parse_mode='Markdown')
 
 
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show user statistics"""
     user = update.effective_user
-    ensure_user_registered(user)
+    await ensure_user_registered(user, update.effective_chat)
     user_id = user.id
 
-    current_streak, best_streak = db.get_streak(user_id)
-    week_stats = db.get_week_stats(user_id)
-    today_status = db.get_today_status(user_id)
+    current_streak, best_streak = await adb.get_streak(user_id)
+    week_stats = await adb.get_week_stats(user_id)
+    month_stats = await adb.get_period_stats(user_id, days=30)
+    all_time_stats = await adb.get_period_stats(user_id)
+    today_status = await adb.get_today_status(user_id)
 
     # Count completed tasks today
     all_tasks = config.MORNING_TASKS + config.AFTERNOON_TASKS
@@ -343,26 +431,124 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         }.get(task_name, '•')
         stats_text += f"{task_emoji} {task_name.title()}: {count}/7\n"
 
+    stats_text += f"""
+📆 **За месяц:** {month_stats['complete_days']} полных дней из {month_stats['active_days']}
+🗂 **За всё время:** {all_time_stats['complete_days']} полных дней из {all_time_stats['active_days']}
+"""
+
     await update.message.reply_text(stats_text, parse_mode='Markdown')
 
 
 async def topic_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show today's IELTS vocabulary topic"""
     user = update.effective_user
-    ensure_user_registered(user)
+    await ensure_user_registered(user, update.effective_chat)
 
     try:
-        # Get today's topic
-        day_number = get_current_day_number(config.TOPICS_START_DATE)
-        topic = get_current_topic(config.TOPICS_START_DATE)
-        message = format_topic_message(topic, day_number)
-
-        await update.message.reply_text(message, parse_mode='Markdown')
+        # Get today's topic of the chat's plan, in the chat's timezone
+        chat_id = update.effective_chat.id
+        today = await adb.get_today(chat_id=chat_id)
+        enrollment = (await adb.get_plan_enrollments([chat_id])).get(chat_id)
+        plan, day_number = resolve_plan_day(enrollment, today)
+        messages = get_catalog(plan).get_messages(day_number)
+
+        for message in messages:
+            await update.message.reply_text(message, parse_mode='Markdown')
     except Exception as e:
         logger.error(f"Error showing topic: {e}")
         await update.message.reply_text("Ошибка при получении топика. Попробуйте позже.")
 
 
+def format_vocab_hit(hit: Dict) -> str:
+    """Format a search result as a Markdown line: phrase, day and topic"""
+    line = f"• *{escape_markdown(hit['phrase'])}* - день {hit['day']}: {escape_markdown(hit['topic'])}"
+    if hit['plan'] != config.TOPIC_PLAN:
+        line += f" ({escape_markdown(hit['plan'])})"
+    return line
+
+
+async def vocab_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Search the vocabulary and key areas of every plan day: /vocab <words>"""
+    user = update.effective_user
+    await ensure_user_registered(user, update.effective_chat)
+
+    query = ' '.join(context.args or [])
+    if not query:
+        await update.message.reply_text("Использование: /vocab work-life balance")
+        return
+
+    hits = vocab_index.search(query, limit=config.VOCAB_SEARCH_RESULTS)
+    if not hits:
+        await update.message.reply_text("Ничего не найдено")
+        return
+
+    lines = [f"🔎 *{escape_markdown(query)}*", ""] + [format_vocab_hit(hit) for hit in hits]
+    await update.message.reply_text("\n".join(lines), parse_mode='Markdown')
+
+
+async def inline_query_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Autocomplete vocabulary in inline mode (@bot <words>)"""
+    query = update.inline_query
+    hits = vocab_index.search(query.query, limit=config.VOCAB_INLINE_RESULTS) if query.query else []
+
+    results = [
+        InlineQueryResultArticle(
+            id=f"{hit['plan']}:{hit['day']}:{index}",
+            title=hit['phrase'],
+            description=f"День {hit['day']}: {hit['topic']}",
+            input_message_content=InputTextMessageContent(format_vocab_hit(hit), parse_mode='Markdown')
+        )
+        for index, hit in enumerate(hits)
+    ]
+    # Results only change with the plans, so Telegram may cache them
+    await query.answer(results, cache_time=300)
+
+
+async def render_next_review(user_id: int, today: date) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """Render the user's next due card with grade buttons, or the day's summary"""
+    card = await adb.get_next_review(user_id, today)
+    stats = await adb.get_review_stats(user_id, today)
+
+    if card is None:
+        text = f"✅ **На сегодня всё!** Выучено: {stats['learned']}/{stats['total']}"
+        if stats['next_due'] is not None:
+            text += f"\nСледующее повторение: {date.fromordinal(stats['next_due']).strftime('%d.%m.%Y')}"
+        return text, None
+
+    try:
+        topic = escape_markdown(get_topic_for_day(card['plan_day'], card['plan'])['name'])
+    except KeyError:
+        # The card's plan was removed from plans/
+        topic = card['plan']
+    text = (
+        f"🧠 **Повторение** (осталось: {stats['due']})\n\n"
+        f"*{escape_markdown(card['phrase'])}*\n"
+        f"📚 День {card['plan_day']}: {topic}\n\n"
+        "Вспомните значение и придумайте пример с этой фразой, затем оцените себя"
+    )
+    keyboard = InlineKeyboardMarkup([[
+        InlineKeyboardButton(label, callback_data=callback_codec.encode(Action.REVIEW, card=card['card_id'], grade=grade))
+        for grade, label in GRADE_LABELS.items()
+    ]])
+    return text, keyboard
+
+
+async def review_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Review due vocabulary cards of the days reached in your plan"""
+    user = update.effective_user
+    await ensure_user_registered(user, update.effective_chat)
+
+    # The plan of the user's private chat; cards for all days reached so far
+    today = await adb.get_today(user_id=user.id)
+    enrollment = (await adb.get_plan_enrollments([user.id])).get(user.id)
+    plan, day_number = resolve_plan_day(enrollment, today)
+    cards = await adb.run(plan_cards, user.id, plan, range(1, day_number + 1))
+    await adb.add_review_cards(cards, today)
+
+    text, keyboard = await render_next_review(user.id, today)
+    await update.message.reply_text(text, reply_markup=keyboard, parse_mode='Markdown')
+
+
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show help message"""
     help_text = """
@@ -374,6 +560,11 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /topic - Показать топик дня (30-day vocabulary plan)
 /stats - Показать статистику и streak
 /all - Показать прогресс всех участников
+/schedule - Время напоминаний этого чата
+/timezone - Временная зона чата (в личке - ваша)
+/plan - План топиков чата: выбрать, пауза, продолжить
+/vocab - Поиск слов по всем дням плана
+/review - Повторение слов (интервальное повторение)
 /help - Эта справка
 
 **Как пользоваться:**
@@ -395,63 +586,290 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(help_text, parse_mode='Markdown')
 
 
+async def refresh_schedule(context: ContextTypes.DEFAULT_TYPE):
+    """Reschedule reminders after a chat or user changed its settings"""
+    scheduler = context.application.bot_data.get('scheduler')
+    if scheduler:
+        await scheduler.refresh()
+
+
+async def schedule_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show or change the chat's reminder times
+
+    /schedule - show, /schedule <morning|afternoon|topic> <HH:MM|default> - change
+    the chat's times, /schedule nudge <HH:MM|default> - change your own
+    private reminder time
+    """
+    user = update.effective_user
+    chat = update.effective_chat
+    await ensure_user_registered(user, chat)
+    args = context.args or []
+
+    if len(args) == 2 and (args[0] in REMINDER_KINDS or args[0] == 'nudge'):
+        kind, value = args
+        if value == 'default':
+            value = None
+        else:
+            try:
+                value = config.parse_time(value).strftime('%H:%M')
+            except ValueError:
+                await update.message.reply_text("Время в формате ЧЧ:ММ, например 08:30")
+                return
+        if kind == 'nudge':
+            await adb.set_user_settings(user.id, reminder_time=value)
+        else:
+            await adb.set_chat_schedule(chat.id, kind, value)
+        await refresh_schedule(context)
+    elif args:
+        await update.message.reply_text(
+            "Использование: /schedule morning|afternoon|topic|nudge ЧЧ:ММ|default"
+        )
+        return
+
+    chat_info = await adb.get_chat(chat.id)
+    timezone = await adb.get_timezone(chat_id=chat.id)
+    titles = {'morning': '🌅 Утренний чек-лист', 'afternoon': '🌤️ Дневной чек-лист', 'topic': '📚 Топик дня'}
+    lines = [
+        f"{titles[kind]}: {chat_info[f'{kind}_time'] or config.REMINDER_TIMES[kind]}"
+        for kind in REMINDER_KINDS
+    ]
+    if config.AFTERNOON_REMINDER_MODE == 'nudge':
+        user_timezone, reminder_time = await adb.get_user_settings(user.id)
+        lines.append(
+            f"🔔 Ваше личное напоминание: {reminder_time or config.AFTERNOON_TIME}"
+            f" ({user_timezone or config.TIMEZONE.zone})"
+        )
+    await update.message.reply_text(
+        f"⏰ **Напоминания этого чата** ({timezone.zone}):\n" + "\n".join(lines),
+        parse_mode='Markdown'
+    )
+
+
+async def timezone_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show or set the timezone: the chat's in groups, your own in private chats
+
+    /timezone - show, /timezone <Area/City|default> - change
+    """
+    user = update.effective_user
+    chat = update.effective_chat
+    await ensure_user_registered(user, chat)
+    args = context.args or []
+
+    if len(args) == 1:
+        name = None if args[0] == 'default' else args[0]
+        if name is not None:
+            try:
+                name = pytz.timezone(name).zone
+            except pytz.UnknownTimeZoneError:
+                await update.message.reply_text("Неизвестная временная зона. Пример: /timezone Europe/Moscow")
+                return
+        if chat.type == 'private':
+            await adb.set_user_settings(user.id, timezone=name)
+        else:
+            await adb.set_chat_timezone(chat.id, name)
+        await refresh_schedule(context)
+    elif args:
+        await update.message.reply_text("Использование: /timezone Europe/Moscow или /timezone default")
+        return
+
+    timezone = await adb.get_timezone(chat_id=chat.id)
+    today = await adb.get_today(chat_id=chat.id)
+    await update.message.reply_text(
+        f"🕰 Временная зона: **{timezone.zone}**\nСегодня: {today.strftime('%d.%m.%Y')}",
+        parse_mode='Markdown'
+    )
+
+
+async def plan_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show or change the chat's topic plan
+
+    /plan - show, /plan <name> [YYYY-MM-DD] - start a plan (today by default),
+    /plan pause, /plan resume, /plan default - back to the shared plan
+    """
+    user = update.effective_user
+    chat = update.effective_chat
+    await ensure_user_registered(user, chat)
+    args = context.args or []
+    today = await adb.get_today(chat_id=chat.id)
+
+    if args == ['pause']:
+        if not await adb.pause_chat_plan(chat.id, today):
+            await update.message.reply_text("План не выбран или уже на паузе")
+            return
+    elif args == ['resume']:
+        if not await adb.resume_chat_plan(chat.id, today):
+            await update.message.reply_text("План не на паузе")
+            return
+    elif args == ['default']:
+        await adb.set_chat_plan(chat.id, None)
+    elif 1 <= len(args) <= 2:
+        name = args[0]
+        start = today
+        if len(args) == 2:
+            try:
+                start = datetime.strptime(args[1], '%Y-%m-%d').date()
+            except ValueError:
+                await update.message.reply_text("Дата в формате ГГГГ-ММ-ДД, например 2024-09-01")
+                return
+        try:
+            await adb.run(get_plan, name)
+        except KeyError:
+            await update.message.reply_text(f"Неизвестный план. Доступные: {', '.join(await adb.run(available_plans))}")
+            return
+        await adb.set_chat_plan(chat.id, name, start)
+    elif args:
+        await update.message.reply_text("Использование: /plan <название> [ГГГГ-ММ-ДД] | pause | resume | default")
+        return
+
+    enrollment = (await adb.get_plan_enrollments([chat.id])).get(chat.id)
+    plan, day_number = resolve_plan_day(enrollment, today)
+    lines = [f"📚 План: **{plan}**, день {day_number}/{len(get_plan(plan))}"]
+    if enrollment is None:
+        lines.append("Общий план бота")
+    elif enrollment[2] is not None:
+        lines.append("⏸ На паузе, продолжить: /plan resume")
+    lines.append(f"Доступные планы: {', '.join(await adb.run(available_plans))}")
+    await update.message.reply_text("\n".join(lines), parse_mode='Markdown')
+
+
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle inline button presses"""
     query = update.callback_query
     user = query.from_user
-    ensure_user_registered(user)
-
-    await query.answer()
+    chat_id = query.message.chat_id
+    await ensure_user_registered(user, update.effective_chat)
 
     data = query.data
 
-    if data.startswith("toggle_"):
-        # Parse callback data: toggle_{user_id}_{task_id}
-        parts = data.split("_", 2)
-        if len(parts) >= 3:
-            target_user_id = int(parts[1])
-            task_id = parts[2]
+    try:
+        payload = callback_codec.decode(data)
+    except CallbackDecodeError:
+        payload = parse_legacy_callback(data)
+    if payload is None:
+        logger.warning(f"Unrecognized callback data: {data}")
+        await query.answer("Кнопка устарела, используйте /today", show_alert=False)
+        return
+
+    action = payload['action']
+
+    if action == Action.TOGGLE:
+        today = await adb.get_today(chat_id=chat_id)
+        if payload.get('day', callback_codec.day_to_field(today)) != callback_codec.day_to_field(today):
+            await query.answer("Этот чек-лист за другой день, используйте /today", show_alert=False)
+            return
+
+        if 'user_id' in payload:
+            target_user_id = payload['user_id']
+            if await adb.get_member_index(chat_id, target_user_id) is None:
+                target_user_id = None
         else:
-            # Old format fallback
-            logger.warning(f"Old callback format detected: {data}")
+            target_user_id = await adb.get_member_user_id(chat_id, payload['member'])
+        if target_user_id is None or payload['task'] >= len(ALL_TASKS):
+            logger.warning(f"Stale callback data: {data}")
+            await query.answer("Кнопка устарела, используйте /today", show_alert=False)
             return
 
-        # Toggle task completion for target user
-        current_status = db.get_today_status(target_user_id)
-        new_status = not current_status.get(task_id, False)
+        await query.answer()
 
-        db.mark_task(target_user_id, task_id, new_status)
+        # Toggle task completion for target user in a single transaction
+        task_id = ALL_TASKS[payload['task']][0]
+        snapshot = await adb.toggle_task(target_user_id, task_id, today, chat_id=chat_id)
 
-        # Update the message with new keyboard (dual column)
-        message_text = format_dual_progress_message()
-        keyboard = create_task_keyboard_dual()
+        # Update the message with the same page, showing the toggled row from
+        # the write's own snapshot. Taps within the debounce window are
+        # merged into one edit of the latest state
+        await edit_coalescer.request_edit(
+            context.bot,
+            chat_id,
+            query.message.message_id,
+            functools.partial(render_dashboard, chat_id, payload['page'], snapshot)
+        )
 
-        try:
-            await query.edit_message_text(
-                text=message_text,
-                reply_markup=keyboard,
-                parse_mode='Markdown'
-            )
-        except Exception as e:
-            logger.error(f"Error editing message: {e}")
-
-    elif data.startswith("task_label_"):
+    elif action == Action.PAGE:
+        await query.answer()
+        await edit_coalescer.request_edit(
+            context.bot,
+            chat_id,
+            query.message.message_id,
+            functools.partial(render_dashboard, chat_id, payload['page'])
+        )
+
+    elif action == Action.LABEL:
         # Just a label, do nothing
         await query.answer("Нажмите на имя чтобы отметить задачу", show_alert=False)
 
-    elif data == "show_all":
-        # Show all users' progress
-        summary = format_all_users_summary()
+    elif action == Action.SHOW_ALL:
+        # Show the progress of all participants of the chat
+        summary = format_all_users_summary(await adb.get_dashboard(chat_id))
         await query.answer(summary, show_alert=True)
 
+    elif action == Action.REVIEW:
+        try:
+            grade = Grade(payload['grade'])
+        except ValueError:
+            await query.answer("Кнопка устарела, используйте /review", show_alert=False)
+            return
+        today = await adb.get_today(user_id=user.id)
+        card = await adb.record_review(user.id, payload['card'], grade, today)
+        if card is None:
+            # Cards shown in a group belong to whoever ran /review
+            await query.answer("Это не ваша карточка, используйте /review", show_alert=False)
+            return
+
+        await query.answer(f"Следующее повторение через {card['interval_days']} дн.")
+        text, keyboard = await render_next_review(user.id, today)
+        await query.edit_message_text(text, reply_markup=keyboard, parse_mode='Markdown')
 
-async def send_group_checklist(context: ContextTypes.DEFAULT_TYPE, checklist_type: str = "morning"):
-    """Send daily checklist to group chat"""
-    if not config.GROUP_CHAT_ID:
-        logger.warning("GROUP_CHAT_ID not configured, skipping group message")
+
+def parse_legacy_callback(data: str) -> Optional[Dict]:
+    """Parse callback data from keyboards sent before the binary codec"""
+    if data == "show_all":
+        return {'action': Action.SHOW_ALL}
+    if data.startswith("task_label_"):
+        return {'action': Action.LABEL, 'task': 0}
+    if data.startswith("toggle_"):
+        # toggle_{user_id}_{task_id}
+        parts = data.split("_", 2)
+        task_ids = [task_id for task_id, _ in ALL_TASKS]
+        if len(parts) == 3 and parts[1].isdigit() and parts[2] in task_ids:
+            return {
+                'action': Action.TOGGLE,
+                'user_id': int(parts[1]),
+                'task': task_ids.index(parts[2]),
+                'page': 0
+            }
+    return None
+
+
+async def get_reminder_chat_ids(chat_ids: Optional[List[int]]) -> List[int]:
+    """Get the chats a reminder goes to: the given ones or every group chat"""
+    if chat_ids is None:
+        chat_ids = await adb.get_group_chat_ids()
+    return chat_ids
+
+
+async def group_chats_by_today(chat_ids: List[int]) -> Dict[date, List[int]]:
+    """Group chats by their own current date (see Database.get_today)"""
+    by_day: Dict[date, List[int]] = {}
+    for chat_id in chat_ids:
+        by_day.setdefault(await adb.get_today(chat_id=chat_id), []).append(chat_id)
+    return by_day
+
+
+async def send_group_checklist(context: ContextTypes.DEFAULT_TYPE, checklist_type: str = "morning",
+                               chat_ids: Optional[List[int]] = None, day: Optional[date] = None):
+    """Send daily checklist to group chats, dated day (each chat's today by default)"""
+    chat_ids = await get_reminder_chat_ids(chat_ids)
+    if not chat_ids:
+        logger.warning("No group chats registered, skipping group message")
+        return
+
+    if day is None:
+        for chat_day, day_chat_ids in (await group_chats_by_today(chat_ids)).items():
+            await send_group_checklist(context, checklist_type, day_chat_ids, chat_day)
         return
 
-    today = date.today()
+    today = day
     is_saturday = today.weekday() == 5
     is_sunday = today.weekday() == 6
 
@@ -472,7 +890,7 @@ async def send_group_checklist(context: ContextTypes.DEFAULT_TYPE, checklist_typ
 """
     else:  # afternoon
         special = "😌 **ЛЁГКИЙ РЕЖИМ**" if is_sunday else ""
-        writing_task = get_writing_task()
+        writing_task = get_writing_task(today)
         message = f"""
 🌤️ **ДНЕВНОЕ НАПОМИНАНИЕ** - {today.strftime('%d.%m.%Y')}
 {special}
@@ -490,52 +908,145 @@ async def send_group_checklist(context: ContextTypes.DEFAULT_TYPE, checklist_typ
 Смотрите прогресс друг друга: /all
 """
 
-    try:
-        await context.bot.send_message(
-            chat_id=config.GROUP_CHAT_ID,
-            text=message,
-            parse_mode='Markdown'
-        )
-    except Exception as e:
-        logger.error(f"Error sending group message: {e}")
+    queued = await outbox.send(chat_ids, checklist_type, message, parse_mode='Markdown', day=today)
+    logger.info(f"Queued {checklist_type} checklist for {queued} chats")
 
 
-async def send_morning_reminder(context: ContextTypes.DEFAULT_TYPE):
+async def send_morning_reminder(context: ContextTypes.DEFAULT_TYPE, chat_ids: Optional[List[int]] = None,
+                                day: Optional[date] = None):
     """Send morning reminder"""
     logger.info("Sending morning reminders")
-    await send_group_checklist(context, "morning")
+    await send_group_checklist(context, "morning", chat_ids, day)
 
 
-async def send_afternoon_reminder(context: ContextTypes.DEFAULT_TYPE):
-    """Send afternoon reminder"""
+async def send_afternoon_reminder(context: ContextTypes.DEFAULT_TYPE, chat_ids: Optional[List[int]] = None,
+                                  day: Optional[date] = None):
+    """Send afternoon reminder to groups
+
+    In nudge mode participants are reminded privately by send_nudges, so
+    only groups with someone who cannot be nudged get the checklist.
+    """
     logger.info("Sending afternoon reminders")
-    await send_group_checklist(context, "afternoon")
+    if config.AFTERNOON_REMINDER_MODE == 'nudge':
+        chat_ids = await get_reminder_chat_ids(chat_ids)
+        by_day = {day: chat_ids} if day is not None else await group_chats_by_today(chat_ids)
+        for chat_day, day_chat_ids in by_day.items():
+            unnudged = await get_unnudged_chat_ids(day_chat_ids, chat_day)
+            if unnudged:
+                await send_group_checklist(context, "afternoon", unnudged, chat_day)
+        return
+    await send_group_checklist(context, "afternoon", chat_ids, day)
+
+
+async def get_unnudged_chat_ids(chat_ids: List[int], day: date) -> List[int]:
+    """Get the chats with participants who have open tasks but no private chat"""
+    unreachable = await adb.get_unreachable_members(chat_ids)
+    user_ids = list({user_id for members in unreachable.values() for user_id in members})
+    if not user_ids:
+        return []
+
+    open_masks = await adb.get_open_task_masks(user_ids, day)
+    unnudged = [chat_id for chat_id, members in unreachable.items()
+                if any(user_id in open_masks for user_id in members)]
+    if open_masks:
+        logger.info(f"{len(open_masks)} participants with open tasks cannot be nudged privately, "
+                    f"sending the afternoon checklist to {len(unnudged)} of their groups")
+    return unnudged
+
+
+def format_nudge_message(mask: int, day: date) -> str:
+    """Format a private reminder listing the tasks not done yet"""
+    status = mask_to_status(mask)
+    remaining = [
+        get_writing_task(day) if task_id == 'writing' else task_name
+        for task_id, task_name in ALL_TASKS
+        if not status.get(task_id, False)
+    ]
+    return (
+        f"🌤️ **Напоминание** - {day.strftime('%d.%m.%Y')}\n\n"
+        f"Осталось на сегодня ({len(remaining)}/{len(ALL_TASKS)}):\n"
+        + "\n".join(remaining)
+        + "\n\nОтметить выполненные: /today"
+    )
+
 
+async def send_nudges(context: ContextTypes.DEFAULT_TYPE, user_ids: Optional[List[int]] = None,
+                      day: Optional[date] = None):
+    """Privately remind group participants who still have open tasks
+
+    Without user_ids every participant who can be messaged is considered;
+    without a day, each user's own today is used.
+    """
+    if user_ids is None:
+        schedule = await adb.get_nudge_schedule()
+        user_ids = [user_id for bucket in schedule.values() for user_id in bucket]
+    if not user_ids:
+        logger.warning("No participants to nudge")
+        return
 
-async def send_daily_topic(context: ContextTypes.DEFAULT_TYPE):
+    by_day: Dict[date, List[int]] = {}
+    for user_id in user_ids:
+        by_day.setdefault(day or await adb.get_today(user_id), []).append(user_id)
+
+    queued = 0
+    for user_day, day_user_ids in by_day.items():
+        open_masks = await adb.get_open_task_masks(day_user_ids, user_day)
+        messages = [(user_id, format_nudge_message(mask, user_day)) for user_id, mask in open_masks.items()]
+        queued += await outbox.send_many(messages, 'nudge', parse_mode='Markdown', day=user_day)
+    logger.info(f"Queued nudges for {queued} participants with open tasks")
+
+
+async def run_review_batch(context: ContextTypes.DEFAULT_TYPE, user_ids: Optional[List[int]] = None,
+                           day: Optional[date] = None):
+    """Nightly review maintenance for every user with cards
+
+    Adds the vocabulary of the plan day each user has reached, then spreads
+    backlogs so nobody gets more than REVIEW_DAILY_LIMIT cards due a day.
+    """
+    day = day or await adb.get_today()
+    if user_ids is None:
+        user_ids = await adb.get_reviewer_ids()
+
+    enrollments = await adb.get_plan_enrollments(user_ids)
+    cards = []
+    for user_id in user_ids:
+        plan, day_number = resolve_plan_day(enrollments.get(user_id), day)
+        cards.extend(plan_cards(user_id, plan, [day_number]))
+    added = await adb.add_review_cards(cards, day)
+    moved = await adb.spread_reviews(day, config.REVIEW_DAILY_LIMIT)
+    logger.info(f"Review batch for {len(user_ids)} users: {added} new cards, {moved} moved to later days")
+
+
+async def send_daily_topic(context: ContextTypes.DEFAULT_TYPE, chat_ids: Optional[List[int]] = None,
+                           day: Optional[date] = None):
     """Send daily IELTS vocabulary topic"""
     logger.info("Sending daily IELTS topic")
 
-    if not config.GROUP_CHAT_ID:
-        logger.warning("GROUP_CHAT_ID not configured, skipping topic message")
+    chat_ids = await get_reminder_chat_ids(chat_ids)
+    if not chat_ids:
+        logger.warning("No group chats registered, skipping topic message")
         return
 
-    try:
-        # Get today's topic
-        day_number = get_current_day_number(config.TOPICS_START_DATE)
-        topic = get_current_topic(config.TOPICS_START_DATE)
-        message = format_topic_message(topic, day_number)
-
-        # Send to group
-        await context.bot.send_message(
-            chat_id=config.GROUP_CHAT_ID,
-            text=message,
-            parse_mode='Markdown'
-        )
-        logger.info(f"Sent topic for Day {day_number}: {topic['name']}")
-
-    except Exception as e:
-        logger.error(f"Error sending daily topic: {e}")
+    # Group the chats by their today and the plan and day they are on;
+    # paused chats get nothing
+    by_day = {day: chat_ids} if day is not None else await group_chats_by_today(chat_ids)
+    enrollments = await adb.get_plan_enrollments(chat_ids)
+    groups: Dict[Tuple[date, str, int], List[int]] = {}
+    for chat_day, day_chat_ids in by_day.items():
+        for chat_id in day_chat_ids:
+            enrollment = enrollments.get(chat_id)
+            if enrollment is not None and enrollment[2] is not None:
+                continue
+            groups.setdefault((chat_day, *resolve_plan_day(enrollment, chat_day)), []).append(chat_id)
+
+    # Long topics are split into several messages
+    for (chat_day, plan, day_number), group in groups.items():
+        messages = get_catalog(plan).get_messages(day_number)
+        for part, message in enumerate(messages, 1):
+            kind = 'topic' if part == 1 else f'topic:{part}'
+            await outbox.send(group, kind, message, parse_mode='Markdown', day=chat_day)
+        logger.info(f"Queued topic for Day {day_number}: {get_topic_for_day(day_number, plan)['name']}"
+                    f" to {len(group)} chats")
 
 
 def main():
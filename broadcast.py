@@ -0,0 +1,237 @@
+"""
+Rate-limited concurrent fan-out of bot messages
+Messages to many chats are sent by a bounded pool of workers. A global
+token bucket keeps the bot under Telegram's overall limit and per-chat
+buckets under the per-chat limits; RetryAfter pauses the affected chat
+and transient network errors are retried with exponential backoff
+
+Benchmark against a fake bot:
+    python broadcast.py [recipients] [latency_ms] [global_rate|none]
+"""
+
+import asyncio
+import functools
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# (chat_id, text) pairs to send
+Recipients = Iterable[Tuple[int, str]]
+
+# Zero-argument coroutine function making one Bot API call
+Call = Callable[[], Awaitable]
+
+# Delivery outcomes: sent, failed after retries, or refused by Telegram
+SENT, FAILED, REJECTED = 'sent', 'failed', 'rejected'
+
+
+class TokenBucket:
+    """Token bucket rate limiter
+
+    Tokens are reserved up front, so waiters queue up in arrival order and
+    each acquire costs a single sleep. A rate of None disables the limit.
+    """
+
+    def __init__(self, rate: Optional[float], capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Take a token and return how long to wait before using it"""
+        if self.rate is None:
+            return 0
+
+        self._refill()
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Wait for a token"""
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds: float):
+        """Hold back the next token for seconds (after a RetryAfter)"""
+        if self.rate is not None:
+            self._refill()
+            self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+    @property
+    def idle(self) -> bool:
+        """Whether the bucket is full again, so dropping it loses nothing"""
+        if self.rate is None:
+            return True
+        return self.tokens + (time.monotonic() - self.updated) * self.rate >= self.capacity
+
+
+class Broadcaster:
+    """Sends messages to many chats with bounded concurrency and rate limits"""
+
+    def __init__(self,
+                 concurrency: int = config.BROADCAST_CONCURRENCY,
+                 global_rate: Optional[float] = config.BROADCAST_GLOBAL_RATE,
+                 private_rate: Optional[float] = config.BROADCAST_PRIVATE_RATE,
+                 group_rate: Optional[float] = config.BROADCAST_GROUP_RATE,
+                 max_retries: int = config.BROADCAST_MAX_RETRIES,
+                 max_tracked_chats: int = 10000):
+        self.concurrency = concurrency
+        self.private_rate = private_rate
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self.max_tracked_chats = max_tracked_chats
+        self._global = TokenBucket(global_rate, capacity=max(1, global_rate or 1))
+        self._chats: OrderedDict = OrderedDict()
+        self._totals = {'broadcasts': 0, 'sent': 0, 'failed': 0, 'rejected': 0, 'retried': 0}
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get counters summed over all broadcasts"""
+        return dict(self._totals)
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # Negative IDs are groups, which Telegram limits far more strictly
+            rate = self.group_rate if chat_id < 0 else self.private_rate
+            bucket = self._chats[chat_id] = TokenBucket(rate)
+            if len(self._chats) > self.max_tracked_chats:
+                # Forget the oldest buckets that have refilled completely
+                for old_id in list(itertools.islice(self._chats, len(self._chats) - self.max_tracked_chats)):
+                    if self._chats[old_id].idle:
+                        del self._chats[old_id]
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    async def broadcast(self, bot, recipients: Recipients, name: str = 'broadcast',
+                        **send_kwargs) -> Dict:
+        """Send each (chat_id, text) with bot.send_message
+
+        Returns the broadcast's metrics, see run.
+        """
+        calls = (
+            (chat_id, functools.partial(bot.send_message, chat_id=chat_id, text=text, **send_kwargs))
+            for chat_id, text in recipients
+        )
+        return await self.run(calls, name)
+
+    async def run(self, calls: Iterable[Tuple[int, Call]], name: str = 'broadcast',
+                  on_result: Optional[Callable[[Call, str, Optional[str]], None]] = None) -> Dict:
+        """Make each (chat_id, call) API call under the chat's rate limits
+
+        on_result, if given, is called with each call, its outcome (SENT,
+        FAILED or REJECTED) and the error message. Returns the metrics:
+        recipients, sent, failed, rejected, retried, seconds, per_second
+        and the failed chat IDs.
+        """
+        metrics = {'name': name, 'recipients': 0, 'sent': 0, 'failed': 0, 'rejected': 0, 'retried': 0}
+        failed_ids: List[int] = []
+        queue: Iterator[Tuple[int, Call]] = iter(calls)
+        started = time.monotonic()
+
+        async def worker():
+            # Workers share one iterator, so recipients are never all in memory
+            for chat_id, call in queue:
+                metrics['recipients'] += 1
+                outcome, error = await self._deliver(chat_id, call, metrics)
+                metrics[outcome] += 1
+                if outcome != SENT:
+                    failed_ids.append(chat_id)
+                if on_result:
+                    on_result(call, outcome, error)
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+
+        seconds = time.monotonic() - started
+        metrics.update(
+            seconds=round(seconds, 3),
+            per_second=round(metrics['sent'] / seconds, 1) if seconds else 0.0,
+            failed_ids=failed_ids
+        )
+
+        self._totals['broadcasts'] += 1
+        for key in ('sent', 'failed', 'rejected', 'retried'):
+            self._totals[key] += metrics[key]
+        logger.info(
+            f"Broadcast {name}: {metrics['sent']}/{metrics['recipients']} sent, "
+            f"{metrics['failed'] + metrics['rejected']} failed, {metrics['retried']} retried "
+            f"in {metrics['seconds']}s ({metrics['per_second']}/s)"
+        )
+        return metrics
+
+    async def _deliver(self, chat_id: int, call: Call, metrics: Dict) -> Tuple[str, Optional[str]]:
+        """Make one API call, retrying flood control and network errors"""
+        bucket = self._chat_bucket(chat_id)
+        error = None
+        for attempt in range(self.max_retries + 1):
+            # Per-chat first, so a slow chat does not hold a global token
+            await bucket.acquire()
+            await self._global.acquire()
+            try:
+                await call()
+                return SENT, None
+            except RetryAfter as e:
+                logger.warning(f"Flood control for {chat_id}, retrying in {e.retry_after}s")
+                bucket.pause(e.retry_after)
+                delay = None if bucket.rate else e.retry_after
+                error = str(e)
+            except (Forbidden, BadRequest) as e:
+                # Blocked by the user, removed from the group, bad markup...
+                logger.error(f"Error sending to {chat_id}: {e}")
+                return REJECTED, str(e)
+            except NetworkError as e:
+                delay = config.BROADCAST_BACKOFF_SECONDS * 2 ** attempt
+                logger.warning(f"Network error sending to {chat_id}, retrying in {delay}s: {e}")
+                error = str(e)
+            except Exception as e:
+                logger.error(f"Error sending to {chat_id}: {e}")
+                return FAILED, str(e)
+
+            if attempt < self.max_retries:
+                metrics['retried'] += 1
+                if delay:
+                    await asyncio.sleep(delay)
+
+        return FAILED, error
+
+
+async def benchmark(recipients: int = 10000, latency: float = 0.05, **broadcaster_kwargs) -> Dict:
+    """Broadcast to a fake bot with a fixed send latency"""
+
+    class FakeBot:
+        async def send_message(self, chat_id, text, **kwargs):
+            await asyncio.sleep(latency)
+
+    broadcaster = Broadcaster(**broadcaster_kwargs)
+    return await broadcaster.broadcast(
+        FakeBot(), ((chat_id, 'benchmark') for chat_id in range(1, recipients + 1)), 'benchmark'
+    )
+
+
+if __name__ == '__main__':
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    latency_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 50
+    kwargs = {}
+    if len(sys.argv) > 3:
+        kwargs['global_rate'] = None if sys.argv[3] == 'none' else float(sys.argv[3])
+    result = asyncio.run(benchmark(count, latency_ms / 1000, **kwargs))
+    result.pop('failed_ids')
+    print(result)
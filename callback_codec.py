@@ -0,0 +1,119 @@
+"""
+Compact callback data codec for inline keyboards
+Payloads are a version byte, an action byte and unsigned varint fields,
+packed as unpadded base64url. Users and tasks are referred to by small
+indexes (participant table / task list), so payloads stay far below
+Telegram's 64-byte limit whatever the user IDs or task names are
+"""
+
+import base64
+from datetime import date
+from enum import IntEnum
+from typing import Dict
+
+CALLBACK_VERSION = 1
+
+# Day fields are stored as days since this date
+DAY_EPOCH = date(2024, 1, 1).toordinal()
+
+# Telegram rejects callback_data longer than this
+MAX_CALLBACK_BYTES = 64
+
+
+class Action(IntEnum):
+    TOGGLE = 1
+    PAGE = 2
+    LABEL = 3
+    SHOW_ALL = 4
+    REVIEW = 5
+
+
+# Field names carried by each action, in wire order
+ACTION_FIELDS = {
+    Action.TOGGLE: ('member', 'task', 'page', 'day'),
+    Action.PAGE: ('page',),
+    Action.LABEL: ('task',),
+    Action.SHOW_ALL: (),
+    Action.REVIEW: ('card', 'grade'),
+}
+
+
+class CallbackDecodeError(ValueError):
+    """Raised for callback data that is malformed or from another codec version"""
+
+
+def day_to_field(day: date) -> int:
+    return day.toordinal() - DAY_EPOCH
+
+
+def field_to_day(value: int) -> date:
+    return date.fromordinal(value + DAY_EPOCH)
+
+
+def _write_varint(out: bytearray, value: int):
+    if value < 0:
+        raise ValueError(f"Callback fields must be non-negative, got {value}")
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+def _read_varint(raw: bytes, pos: int):
+    value = shift = 0
+    while True:
+        if pos >= len(raw):
+            raise CallbackDecodeError("Truncated callback data")
+        byte = raw[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def encode(action: Action, **fields: int) -> str:
+    """Encode an action and its fields as callback data"""
+    names = ACTION_FIELDS[action]
+    if set(fields) != set(names):
+        raise ValueError(f"{action.name} takes fields {names}, got {tuple(fields)}")
+
+    raw = bytearray((CALLBACK_VERSION, action))
+    for name in names:
+        _write_varint(raw, fields[name])
+
+    data = base64.urlsafe_b64encode(bytes(raw)).rstrip(b'=').decode('ascii')
+    if len(data) > MAX_CALLBACK_BYTES:
+        raise ValueError(f"Callback data too long: {len(data)} bytes")
+    return data
+
+
+def decode(data: str) -> Dict[str, int]:
+    """Decode callback data into a dict with 'action' and the action's fields"""
+    try:
+        raw = base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+    except (ValueError, TypeError) as e:
+        raise CallbackDecodeError(f"Not a codec payload: {data!r}") from e
+
+    if len(raw) < 2:
+        raise CallbackDecodeError(f"Not a codec payload: {data!r}")
+    if raw[0] != CALLBACK_VERSION:
+        raise CallbackDecodeError(f"Unsupported callback version {raw[0]}")
+    try:
+        action = Action(raw[1])
+    except ValueError as e:
+        raise CallbackDecodeError(f"Unknown callback action {raw[1]}") from e
+
+    result = {'action': action}
+    pos = 2
+    for name in ACTION_FIELDS[action]:
+        result[name], pos = _read_varint(raw, pos)
+    if pos != len(raw):
+        raise CallbackDecodeError("Trailing bytes in callback data")
+
+    return result
+
@@ -44,9 +44,70 @@ MORNING_REMINDER = parse_time(MORNING_TIME)
 AFTERNOON_REMINDER = parse_time(AFTERNOON_TIME)
 TOPIC_REMINDER = parse_time(TOPIC_TIME)
 
+# Afternoon reminder: 'group' posts the checklist to each group, 'nudge'
+# messages each participant who has not finished privately, listing only
+# the remaining tasks (groups with unfinished participants who have no
+# private chat with the bot still get the checklist)
+AFTERNOON_REMINDER_MODE = os.getenv('AFTERNOON_REMINDER_MODE', 'group')
+
+# Default reminder times by kind; chats may override them with /schedule
+REMINDER_TIMES = {'morning': MORNING_TIME, 'afternoon': AFTERNOON_TIME, 'topic': TOPIC_TIME}
+
+# Webhook mode: set WEBHOOK_URL (public HTTPS base URL) to receive updates
+# via webhook instead of long polling
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', os.getenv('PORT', '8443')))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+# Checked on every request; a random one is used per start if empty
+WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN', '')
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+
+# Updates handled at once; updates from the same chat still run one by one
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', '16'))
+# Updates accepted before further ones wait in the application's queue
+UPDATE_MAX_QUEUED = int(os.getenv('UPDATE_MAX_QUEUED', '1024'))
+
 # Database
 DB_PATH = os.getenv('DB_PATH', 'bot_data.db')
 
+# SQLite connection tuning
+DB_BUSY_TIMEOUT = float(os.getenv('DB_BUSY_TIMEOUT', '5'))  # seconds to wait on a locked database
+DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', '256'))
+DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', '8192'))
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', str(64 * 1024 * 1024)))
+
+# Completion storage layout:
+# 'rows'    - one completions row per task with timestamps, plus the per-day mask
+# 'bitmask' - only the per-day mask (about 7x smaller history)
+COMPLETIONS_LAYOUT = os.getenv('COMPLETIONS_LAYOUT', 'rows')
+
+# Dashboard edits triggered within this window are merged into one (seconds)
+EDIT_DEBOUNCE_SECONDS = float(os.getenv('EDIT_DEBOUNCE_SECONDS', '0.7'))
+
+# Participants shown side by side per dashboard page (Telegram allows 8 buttons per row)
+DASHBOARD_PAGE_SIZE = min(max(int(os.getenv('DASHBOARD_PAGE_SIZE', '4')), 1), 8)
+
+# Maximum number of cached message texts, keyboards and button rows
+RENDER_CACHE_SIZE = int(os.getenv('RENDER_CACHE_SIZE', '2048'))
+
+# Reminder fan-out: concurrent sends and rate limits (messages per second).
+# Telegram allows about 30/s overall, 1/s per private chat and 20/min per group
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', '20'))
+BROADCAST_GLOBAL_RATE = float(os.getenv('BROADCAST_GLOBAL_RATE', '25'))
+BROADCAST_PRIVATE_RATE = float(os.getenv('BROADCAST_PRIVATE_RATE', '1'))
+BROADCAST_GROUP_RATE = float(os.getenv('BROADCAST_GROUP_RATE', str(20 / 60)))
+BROADCAST_MAX_RETRIES = int(os.getenv('BROADCAST_MAX_RETRIES', '3'))
+BROADCAST_BACKOFF_SECONDS = float(os.getenv('BROADCAST_BACKOFF_SECONDS', '1'))
+
+# Durable outgoing message queue
+OUTBOX_POLL_SECONDS = float(os.getenv('OUTBOX_POLL_SECONDS', '5'))
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '200'))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+OUTBOX_RETRY_BASE_SECONDS = float(os.getenv('OUTBOX_RETRY_BASE_SECONDS', '5'))
+OUTBOX_RETRY_MAX_SECONDS = float(os.getenv('OUTBOX_RETRY_MAX_SECONDS', '900'))
+OUTBOX_RETENTION_DAYS = int(os.getenv('OUTBOX_RETENTION_DAYS', '7'))
+
 # Task configuration by day of week (0=Monday, 6=Sunday)
 WRITING_SCHEDULE = {
     0: 'Task 2',  # Monday
@@ -78,3 +139,16 @@ AFTERNOON_TASKS = [
 from datetime import datetime as dt
 TOPICS_START_DATE_STR = os.getenv('TOPICS_START_DATE', None)
 TOPICS_START_DATE = dt.strptime(TOPICS_START_DATE_STR, '%Y-%m-%d').date() if TOPICS_START_DATE_STR else None
+
+# Topic plan packs: plans/<name>.jsonl sources, compiled to .pack files
+PLANS_DIR = os.getenv('PLANS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'plans'))
+TOPIC_PLAN = os.getenv('TOPIC_PLAN', 'ielts-30')
+
+# Vocabulary search results per /vocab reply and per inline query
+VOCAB_SEARCH_RESULTS = int(os.getenv('VOCAB_SEARCH_RESULTS', '10'))
+VOCAB_INLINE_RESULTS = min(int(os.getenv('VOCAB_INLINE_RESULTS', '20')), 50)
+
+# Spaced repetition: time of the nightly batch that adds the day's words and
+# spreads backlogs, and the most cards a user gets due per day
+REVIEW_BATCH_TIME = os.getenv('REVIEW_BATCH_TIME', '03:00')
+REVIEW_DAILY_LIMIT = max(int(os.getenv('REVIEW_DAILY_LIMIT', '50')), 1)
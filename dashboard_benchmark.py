@@ -0,0 +1,82 @@
+"""
+Benchmark of dashboard rendering for growing chats
+For chats of 2, 10, 50 and 200 participants, renders the first and the
+last page of the dashboard (message text and keyboard), cold and from
+the render cache, and reports the keyboard's size
+
+    python dashboard_benchmark.py [rounds] [sizes...]
+
+Cold renders clear the whole render cache first, so they include the
+shared task label row as well as the participants' buttons.
+"""
+
+import asyncio
+import logging
+import sys
+import time
+from typing import Dict, List
+
+from benchmark_support import use_throwaway_database
+
+use_throwaway_database()
+
+import config
+from bot import render_cache, render_dashboard
+from database import TASK_BITS, adb, db
+
+SIZES = (2, 10, 50, 200)
+
+
+def _add_chat(participants: int) -> int:
+    """Create a group with participants who have done some of today's tasks"""
+    chat_id = -1000 - participants
+    db.add_chat(chat_id)
+    task_names = list(TASK_BITS)
+    for i in range(participants):
+        user_id = participants * 1000 + i
+        db.add_user(user_id, f'User{i} Benchmark')
+        db.add_member(chat_id, user_id)
+        for task_name in task_names[:i % len(task_names)]:
+            db.toggle_task(user_id, task_name)
+    return chat_id
+
+
+async def _time_render(chat_id: int, page: int, rounds: int, cold: bool) -> float:
+    """Mean milliseconds to render a dashboard page"""
+    elapsed = 0.0
+    for _ in range(rounds):
+        if cold:
+            render_cache.clear()
+        started = time.perf_counter()
+        await render_dashboard(chat_id, page)
+        elapsed += time.perf_counter() - started
+    return round(elapsed / rounds * 1000, 3)
+
+
+async def benchmark(rounds: int = 200, sizes: List[int] = SIZES) -> Dict:
+    """Measure dashboard renders for each chat size"""
+    results = {'page_size': config.DASHBOARD_PAGE_SIZE}
+    for participants in sizes:
+        chat_id = _add_chat(participants)
+        page_count = (await adb.get_dashboard_page(chat_id, 0, config.DASHBOARD_PAGE_SIZE))['page_count']
+        last_page = page_count - 1
+
+        _, keyboard = await render_dashboard(chat_id, last_page)
+        buttons = [button for row in keyboard.inline_keyboard for button in row]
+        results[participants] = {
+            'pages': page_count,
+            'buttons': len(buttons),
+            'max_callback_bytes': max(len(button.callback_data.encode()) for button in buttons),
+            'first_page_cold_ms': await _time_render(chat_id, 0, rounds, cold=True),
+            'last_page_cold_ms': await _time_render(chat_id, last_page, rounds, cold=True),
+            'first_page_cached_ms': await _time_render(chat_id, 0, rounds, cold=False),
+            'last_page_cached_ms': await _time_render(chat_id, last_page, rounds, cold=False),
+        }
+    return results
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    round_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    chat_sizes = [int(size) for size in sys.argv[2:]] or list(SIZES)
+    print(asyncio.run(benchmark(round_count, chat_sizes)))
@@ -1,15 +1,157 @@
+import asyncio
+import functools
+import json
 import sqlite3
-from datetime import datetime, date
-from typing import Optional, Dict, List, Tuple
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date, timedelta, tzinfo
+from typing import Iterable, Optional, Dict, List, Tuple
+import pytz
 import config
+from review import INITIAL_EASE, Grade, schedule_review
+
+# Bit positions for the per-day completion mask. Append new tasks to the
+# config lists instead of reordering them, or stored masks change meaning.
+TASK_BITS = {
+    task_id: 1 << position
+    for position, (task_id, _) in enumerate(config.MORNING_TASKS + config.AFTERNOON_TASKS)
+}
+
+
+# Chat types that receive group reminders
+GROUP_CHAT_TYPES = ('group', 'supergroup')
+
+# Reminder kinds with a per-chat time column in the chats table
+REMINDER_KINDS = tuple(config.REMINDER_TIMES)
+
+CHAT_FIELDS = ('chat_id', 'chat_type', 'title', 'morning_time', 'afternoon_time', 'topic_time', 'timezone',
+               'plan', 'plan_start', 'plan_paused_at')
+
+# Columns of review_cards as card dict keys
+REVIEW_CARD_FIELDS = ('card_id', 'plan', 'plan_day', 'item', 'phrase', 'ease', 'interval_days',
+                      'repetitions', 'lapses', 'due')
+
+# A chat's topic plan: (plan name, start day, day it was paused or None),
+# days as date ordinals
+PlanEnrollment = Tuple[str, int, Optional[int]]
+
+
+def local_today(tz: Optional[tzinfo] = None) -> date:
+    """Get the current date in a timezone, config.TIMEZONE by default"""
+    return datetime.now(tz or config.TIMEZONE).date()
+
+
+def utc_today() -> date:
+    """Get the current UTC date; every local date is within a day of it"""
+    return datetime.now(pytz.utc).date()
+
+
+def mask_to_status(mask: int) -> Dict[str, bool]:
+    """Expand a completion mask into a {task_id: completed} dict"""
+    return {task_id: bool(mask & bit) for task_id, bit in TASK_BITS.items()}
+
 
 class Database:
     def __init__(self, db_path: str = config.DB_PATH):
         self.db_path = db_path
+        # One long-lived connection per thread, closed together in close()
+        self._local = threading.local()
+        self._pool: List[sqlite3.Connection] = []
+        self._pool_lock = threading.Lock()
+        # Read-through caches; day masks are kept only for the dates that are
+        # "today" somewhere
+        self._cache_lock = threading.RLock()
+        self._user_names: Optional[Dict[int, str]] = None
+        # {user_id: (timezone, reminder_time)} for users who set either
+        self._user_settings: Dict[int, Tuple[Optional[str], Optional[str]]] = {}
+        self._chats: Optional[Dict[int, Dict]] = None
+        # Per chat: {user_id: member_index} in member order, the reverse, and
+        # the user IDs as a list in member order for slicing pages
+        self._chat_members: Dict[int, Dict[int, int]] = {}
+        self._chat_member_ids: Dict[int, Dict[int, int]] = {}
+        self._chat_member_order: Dict[int, List[int]] = {}
+        self._streaks: Dict[int, Tuple[int, int]] = {}
+        self._day_masks: Dict[date, Dict[int, int]] = {}
+        # Bumped on every change to a user's name, status or streak
+        self._versions: Dict[int, int] = {}
+        self._cache_hits = 0
+        self._cache_misses = 0
         self.init_db()
 
-    def get_connection(self):
-        return sqlite3.connect(self.db_path)
+    def get_connection(self) -> sqlite3.Connection:
+        """Get the pooled connection for the current thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._pool_lock:
+                self._pool.append(conn)
+        return conn
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a new connection with WAL journaling and tuned pragmas"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=config.DB_BUSY_TIMEOUT,
+            cached_statements=config.DB_STATEMENT_CACHE_SIZE,
+            check_same_thread=False
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        # NORMAL is durable under WAL except for the last commits on power loss
+        conn.execute('PRAGMA synchronous=NORMAL')
+        # Negative cache_size is in KiB rather than pages
+        conn.execute(f'PRAGMA cache_size=-{config.DB_CACHE_SIZE_KB}')
+        conn.execute(f'PRAGMA mmap_size={config.DB_MMAP_SIZE}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+
+    def close(self):
+        """Close all pooled connections"""
+        with self._pool_lock:
+            for conn in self._pool:
+                conn.close()
+            self._pool.clear()
+        self._local = threading.local()
+
+    def get_cache_stats(self) -> Dict[str, int]:
+        """Get read-through cache hit and miss counters"""
+        with self._cache_lock:
+            return {'hits': self._cache_hits, 'misses': self._cache_misses}
+
+    def _count_cache(self, hits: int = 0, misses: int = 0):
+        with self._cache_lock:
+            self._cache_hits += hits
+            self._cache_misses += misses
+
+    def _cached_masks(self, day: date) -> Optional[Dict[int, int]]:
+        """Get the mask cache for `day` if it is today in some timezone
+
+        Masks of days that are over everywhere are dropped.
+        """
+        today = utc_today()
+        with self._cache_lock:
+            for old_day in [d for d in self._day_masks if d < today - timedelta(days=1)]:
+                del self._day_masks[old_day]
+            if abs((day - today).days) > 1:
+                return None
+            return self._day_masks.setdefault(day, {})
+
+    def _invalidate_user_state(self, user_id: int):
+        """Drop cached status and streak after a write for this user"""
+        with self._cache_lock:
+            for masks in self._day_masks.values():
+                masks.pop(user_id, None)
+            self._streaks.pop(user_id, None)
+            self._bump_version(user_id)
+
+    def _bump_version(self, user_id: int):
+        with self._cache_lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    def get_state_version(self, user_id: int) -> int:
+        """Get a process-local counter that changes whenever the user's state does"""
+        with self._cache_lock:
+            return self._versions.get(user_id, 0)
 
     def init_db(self):
         """Initialize database tables"""
@@ -25,6 +167,71 @@ class Database:
             )
         ''')
 
+        # Optional own timezone and private reminder time ('HH:MM')
+        self._ensure_column(cursor, 'users', 'timezone', 'TEXT')
+        self._ensure_column(cursor, 'users', 'reminder_time', 'TEXT')
+
+        # Chats the bot serves; reminder times are NULL for config defaults
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS chats (
+                chat_id INTEGER PRIMARY KEY,
+                chat_type TEXT NOT NULL DEFAULT 'group',
+                title TEXT,
+                morning_time TEXT,
+                afternoon_time TEXT,
+                topic_time TEXT,
+                timezone TEXT,
+                plan TEXT,
+                plan_start INTEGER,
+                plan_paused_at INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self._ensure_column(cursor, 'chats', 'timezone', 'TEXT')
+        # Topic plan enrollment; plan_start is shifted forward on resume so
+        # the current day is always today - plan_start
+        self._ensure_column(cursor, 'chats', 'plan', 'TEXT')
+        self._ensure_column(cursor, 'chats', 'plan_start', 'INTEGER')
+        self._ensure_column(cursor, 'chats', 'plan_paused_at', 'INTEGER')
+
+        # Chat participants; member_index is the dense per-chat participant
+        # number used in callback data
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chat_members'")
+        members_exist = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS chat_members (
+                chat_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                member_index INTEGER NOT NULL,
+                joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (chat_id, user_id),
+                UNIQUE (chat_id, member_index)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_chat_members_user
+            ON chat_members (user_id, chat_id)
+        ''')
+        # Databases from before chat_members numbered users globally in
+        # users.member_index; that order only seeds the configured group
+        cursor.execute('PRAGMA table_info(users)')
+        global_index = 'member_index' in {row[1] for row in cursor.fetchall()}
+        if not members_exist and config.GROUP_CHAT_ID:
+            # Single-group databases: everyone so far belongs to the configured
+            # group, in the order they joined
+            cursor.execute('''
+                INSERT OR IGNORE INTO chats (chat_id, chat_type) VALUES (?, 'group')
+            ''', (config.GROUP_CHAT_ID,))
+            join_order = 'member_index, created_at, user_id' if global_index else 'created_at, user_id'
+            cursor.execute(f'''
+                INSERT INTO chat_members (chat_id, user_id, member_index)
+                SELECT ?, user_id, ROW_NUMBER() OVER (ORDER BY {join_order}) - 1
+                FROM users
+            ''', (config.GROUP_CHAT_ID,))
+        if global_index:
+            cursor.execute('DROP INDEX IF EXISTS idx_users_member_index')
+            cursor.execute('ALTER TABLE users DROP COLUMN member_index')
+
         # Daily checklist completions
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS completions (
@@ -50,93 +257,858 @@ class Database:
             )
         ''')
 
+        # Streak state before the latest advance, so un-completing a day can
+        # restore it exactly
+        added = [self._ensure_column(cursor, 'streaks', column, column_type)
+                 for column, column_type in (('prev_streak', 'INTEGER DEFAULT 0'),
+                                             ('prev_best_streak', 'INTEGER DEFAULT 0'),
+                                             ('prev_completion_date', 'DATE'))]
+        if any(added):
+            # The advance that led to existing rows is unknown; saving the
+            # current state makes un-completing a day keep the streak
+            # rather than reset it to zero
+            cursor.execute('''
+                UPDATE streaks
+                SET prev_streak = current_streak,
+                    prev_best_streak = best_streak,
+                    prev_completion_date = last_completion_date
+            ''')
+
+        # One row per user and day: completed task counter and bitmask of
+        # completed tasks, kept in step with every mark_task
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_rollup'")
+        rebuild_rollup = cursor.fetchone() is None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS daily_rollup (
+                user_id INTEGER NOT NULL,
+                date DATE NOT NULL,
+                completed_count INTEGER NOT NULL DEFAULT 0,
+                mask INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, date)
+            ) WITHOUT ROWID
+        ''')
+        if self._ensure_column(cursor, 'daily_rollup', 'mask', 'INTEGER NOT NULL DEFAULT 0'):
+            rebuild_rollup = True
+        if rebuild_rollup:
+            self._rebuild_rollup(cursor)
+
+        # Durable queue of outgoing messages; one row per (chat, kind, date)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY,
+                chat_id INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                date DATE NOT NULL,
+                text TEXT NOT NULL,
+                parse_mode TEXT,
+                reply_markup TEXT,
+                message_id INTEGER,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                last_error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE (chat_id, kind, date)
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_outbox_due
+            ON outbox (next_attempt_at) WHERE status = 'pending'
+        ''')
+
+        # Spaced repetition cards, one per user and plan phrase; due is a
+        # date ordinal. The (user_id, due) index is each user's due queue:
+        # the next card is its first entry
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS review_cards (
+                card_id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                plan TEXT NOT NULL,
+                plan_day INTEGER NOT NULL,
+                item INTEGER NOT NULL,
+                phrase TEXT NOT NULL,
+                ease REAL NOT NULL,
+                interval_days INTEGER NOT NULL DEFAULT 0,
+                repetitions INTEGER NOT NULL DEFAULT 0,
+                lapses INTEGER NOT NULL DEFAULT 0,
+                due INTEGER NOT NULL,
+                reviewed_at TIMESTAMP,
+                UNIQUE (user_id, plan, plan_day, item)
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_review_due
+            ON review_cards (user_id, due, card_id)
+        ''')
+
+        # Covering index of all users' rollup rows for a given day. Per-user
+        # reads go through the rollup's primary key instead, so completions
+        # needs no index beyond its own
+        cursor.execute('DROP INDEX IF EXISTS idx_completions_user_done')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_daily_rollup_date
+            ON daily_rollup (date, user_id, completed_count, mask)
+        ''')
+
+        if config.COMPLETIONS_LAYOUT == 'bitmask':
+            # The rollup masks are the source of truth in this layout, so the
+            # per-task rows of known tasks are no longer needed
+            cursor.execute('''
+                DELETE FROM completions
+                WHERE task_name IN (SELECT key FROM json_each(?))
+            ''', (json.dumps(TASK_BITS),))
+
         conn.commit()
-        conn.close()
+
+    @staticmethod
+    def _rebuild_rollup(cursor):
+        """Recompute daily_rollup counters and masks from completions"""
+        cursor.execute('''
+            WITH bits (task_name, bit) AS (SELECT key, value FROM json_each(?))
+            INSERT OR REPLACE INTO daily_rollup (user_id, date, completed_count, mask)
+            SELECT c.user_id, c.date, COUNT(*), SUM(b.bit)
+            FROM completions c
+            JOIN bits b ON b.task_name = c.task_name
+            WHERE c.completed = 1
+            GROUP BY c.user_id, c.date
+        ''', (json.dumps(TASK_BITS),))
+
+    @staticmethod
+    def _ensure_column(cursor, table: str, column: str, column_type: str) -> bool:
+        """Add a column to an existing table if it is missing
+
+        Returns True if the column was added.
+        """
+        cursor.execute(f'PRAGMA table_info({table})')
+        if column in {row[1] for row in cursor.fetchall()}:
+            return False
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+        return True
 
     def add_user(self, user_id: int, name: str = None, first_name: str = None,
-                 last_name: str = None, username: str = None):
-        """Add or update user"""
+                 last_name: str = None, username: str = None) -> bool:
+        """Add a user, or rename them if an explicit name is given
+
+        An explicit name (e.g. from STUDY_BUDDIES) always wins. A Telegram
+        first_name only names new users and never overwrites a stored name.
+        Known users with an unchanged name are skipped without any write.
+        Returns True if the database was written.
+        """
+        known_name = self._get_user_names().get(user_id)
+        if known_name is not None and (not name or name == known_name):
+            return False
+
         conn = self.get_connection()
         cursor = conn.cursor()
 
-        # Use first_name as default name if name not provided
-        if not name:
+        if name:
+            upsert = '''
+                INSERT INTO users (user_id, name)
+                VALUES (?, ?)
+                ON CONFLICT (user_id) DO UPDATE
+                SET name = excluded.name
+                WHERE name != excluded.name
+            '''
+        else:
+            # Use first_name as default name if name not provided
             name = first_name or f"User {user_id}"
+            upsert = '''
+                INSERT INTO users (user_id, name)
+                VALUES (?, ?)
+                ON CONFLICT (user_id) DO NOTHING
+            '''
+
+        # The connection context commits, or rolls back so the pooled
+        # connection is never left inside a failed transaction
+        with conn:
+            cursor.execute(upsert, (user_id, name))
 
+            # Initialize streak if not exists
+            cursor.execute('''
+                INSERT OR IGNORE INTO streaks (user_id, current_streak, best_streak)
+                VALUES (?, 0, 0)
+            ''', (user_id,))
+
+            cursor.execute('SELECT name FROM users WHERE user_id = ?', (user_id,))
+            stored_name = cursor.fetchone()[0]
+
+        with self._cache_lock:
+            if self._user_names is not None:
+                self._user_names[user_id] = stored_name
+            self._bump_version(user_id)
+
+        return True
+
+    def _get_user_names(self) -> Dict[int, str]:
+        """Get the cached {user_id: name} table, loading it on first use"""
+        with self._cache_lock:
+            if self._user_names is not None:
+                self._cache_hits += 1
+                return self._user_names
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT user_id, name, timezone, reminder_time FROM users ORDER BY created_at, user_id')
+        names = {}
+        settings = {}
+        for user_id, name, timezone, reminder_time in cursor.fetchall():
+            names[user_id] = name
+            if timezone or reminder_time:
+                settings[user_id] = (timezone, reminder_time)
+
+        with self._cache_lock:
+            self._cache_misses += 1
+            self._user_names = names
+            self._user_settings = settings
+            return names
+
+    def set_user_settings(self, user_id: int, **settings: Optional[str]):
+        """Set a user's timezone and/or reminder_time ('HH:MM'); None restores the default"""
+        unknown = set(settings) - {'timezone', 'reminder_time'}
+        if unknown:
+            raise ValueError(f"Unknown user settings: {sorted(unknown)}")
+        if not settings:
+            return
+
+        assignments = ', '.join(f'{name} = :{name}' for name in settings)
+        conn = self.get_connection()
+        with conn:
+            conn.execute(f'UPDATE users SET {assignments} WHERE user_id = :user_id',
+                         dict(settings, user_id=user_id))
+
+        self._get_user_names()
+        with self._cache_lock:
+            timezone, reminder_time = self._user_settings.get(user_id, (None, None))
+            timezone = settings.get('timezone', timezone)
+            reminder_time = settings.get('reminder_time', reminder_time)
+            if timezone or reminder_time:
+                self._user_settings[user_id] = (timezone, reminder_time)
+            else:
+                self._user_settings.pop(user_id, None)
+            self._bump_version(user_id)
+
+    def get_user_settings(self, user_id: int) -> Tuple[Optional[str], Optional[str]]:
+        """Get a user's own (timezone, reminder_time), None where unset"""
+        self._get_user_names()
+        with self._cache_lock:
+            return self._user_settings.get(user_id, (None, None))
+
+    def get_timezone(self, user_id: Optional[int] = None, chat_id: Optional[int] = None) -> tzinfo:
+        """Get the timezone of a chat or user
+
+        A chat's own timezone wins; a private chat falls back to its user's
+        (private chat IDs are user IDs), and everything else to
+        config.TIMEZONE.
+        """
+        name = None
+        if chat_id is not None:
+            chat = self._get_chats().get(chat_id)
+            name = chat['timezone'] if chat else None
+            if name is None and chat_id > 0 and user_id is None:
+                user_id = chat_id
+        if name is None and user_id is not None:
+            name = self.get_user_settings(user_id)[0]
+        return pytz.timezone(name) if name else config.TIMEZONE
+
+    def get_today(self, user_id: Optional[int] = None, chat_id: Optional[int] = None) -> date:
+        """Get the current date of a chat or user, see get_timezone"""
+        return local_today(self.get_timezone(user_id, chat_id))
+
+    def _get_chats(self) -> Dict[int, Dict]:
+        """Get the cached chats table, loading it on first use"""
+        with self._cache_lock:
+            if self._chats is not None:
+                self._cache_hits += 1
+                return self._chats
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT {", ".join(CHAT_FIELDS)} FROM chats')
+        chats = {
+            row[0]: dict(zip(CHAT_FIELDS, row))
+            for row in cursor.fetchall()
+        }
+
+        with self._cache_lock:
+            self._cache_misses += 1
+            self._chats = chats
+            return chats
+
+    def add_chat(self, chat_id: int, chat_type: str = 'group', title: Optional[str] = None) -> bool:
+        """Register a chat or update its type and title
+
+        Known chats with unchanged details are skipped without any write.
+        Returns True if the database was written.
+        """
+        known = self._get_chats().get(chat_id)
+        if known is not None and known['chat_type'] == chat_type and known['title'] == title:
+            return False
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        with conn:
+            cursor.execute('''
+                INSERT INTO chats (chat_id, chat_type, title)
+                VALUES (?, ?, ?)
+                ON CONFLICT (chat_id) DO UPDATE
+                SET chat_type = excluded.chat_type, title = excluded.title
+            ''', (chat_id, chat_type, title))
+
+        with self._cache_lock:
+            chat = self._chats.setdefault(chat_id, dict.fromkeys(CHAT_FIELDS))
+            chat.update(chat_id=chat_id, chat_type=chat_type, title=title)
+
+        return True
+
+    def get_chat(self, chat_id: int) -> Optional[Dict]:
+        """Get a chat's type, title and reminder times, or None if unknown"""
+        chat = self._get_chats().get(chat_id)
+        return dict(chat) if chat is not None else None
+
+    def get_group_chat_ids(self) -> List[int]:
+        """Get the IDs of all group chats, the targets of group reminders"""
+        with self._cache_lock:
+            return [
+                chat_id for chat_id, chat in self._get_chats().items()
+                if chat['chat_type'] in GROUP_CHAT_TYPES
+            ]
+
+    def set_chat_schedule(self, chat_id: int, kind: str, reminder_time: Optional[str]):
+        """Set a chat's reminder time ('HH:MM') for morning, afternoon or topic
+
+        None restores the configured default.
+        """
+        if kind not in REMINDER_KINDS:
+            raise ValueError(f"Unknown reminder kind: {kind}")
+        self._set_chat_field(chat_id, f'{kind}_time', reminder_time)
+
+    def set_chat_timezone(self, chat_id: int, timezone: Optional[str]):
+        """Set a chat's timezone name; None restores the default"""
+        self._set_chat_field(chat_id, 'timezone', timezone)
+
+    def _set_chat_field(self, chat_id: int, column: str, value: Optional[str]):
+        self._set_chat_fields(chat_id, {column: value})
+
+    def _set_chat_fields(self, chat_id: int, values: Dict[str, Optional[object]]):
+        conn = self.get_connection()
+        assignments = ', '.join(f'{column} = ?' for column in values)
+        with conn:
+            conn.execute(f'UPDATE chats SET {assignments} WHERE chat_id = ?', (*values.values(), chat_id))
+
+        with self._cache_lock:
+            chat = self._get_chats().get(chat_id)
+            if chat is not None:
+                chat.update(values)
+
+    def set_chat_plan(self, chat_id: int, plan: Optional[str], start: Optional[date] = None):
+        """Enroll a chat in a topic plan starting on day 1 at start
+
+        None for plan returns the chat to the configured default plan.
+        """
+        self._set_chat_fields(chat_id, {
+            'plan': plan,
+            'plan_start': start.toordinal() if plan is not None else None,
+            'plan_paused_at': None,
+        })
+
+    def pause_chat_plan(self, chat_id: int, day: date) -> bool:
+        """Stop a chat's plan at its current day
+
+        Returns False if the chat has no plan or it is already paused.
+        """
+        enrollment = self.get_plan_enrollments([chat_id]).get(chat_id)
+        if enrollment is None or enrollment[2] is not None:
+            return False
+        self._set_chat_fields(chat_id, {'plan_paused_at': day.toordinal()})
+        return True
+
+    def resume_chat_plan(self, chat_id: int, day: date) -> bool:
+        """Continue a paused plan from the day it was paused at
+
+        Returns False if the chat has no paused plan.
+        """
+        enrollment = self.get_plan_enrollments([chat_id]).get(chat_id)
+        if enrollment is None or enrollment[2] is None:
+            return False
+        _, start, paused_at = enrollment
+        self._set_chat_fields(chat_id, {
+            'plan_start': start + max(0, day.toordinal() - paused_at),
+            'plan_paused_at': None,
+        })
+        return True
+
+    def get_plan_enrollments(self, chat_ids: Iterable[int]) -> Dict[int, PlanEnrollment]:
+        """Get the plan enrollments of those chats that have one"""
+        chats = self._get_chats()
+        enrollments = {}
+        with self._cache_lock:
+            for chat_id in chat_ids:
+                chat = chats.get(chat_id)
+                if chat is not None and chat['plan'] is not None:
+                    enrollments[chat_id] = (chat['plan'], chat['plan_start'], chat['plan_paused_at'])
+        return enrollments
+
+    def get_reminder_schedule(self, kind: str) -> Dict[Tuple[str, str], List[int]]:
+        """Get the group chats due a reminder kind, by (timezone, 'HH:MM')
+
+        Chats without their own settings fall under the configured defaults,
+        which are always present.
+        """
+        column = f'{kind}_time'
+        default = (config.TIMEZONE.zone, config.REMINDER_TIMES[kind])
+        schedule = {default: []}
+        with self._cache_lock:
+            for chat_id, chat in self._get_chats().items():
+                if chat['chat_type'] in GROUP_CHAT_TYPES:
+                    key = (chat['timezone'] or default[0], chat[column] or default[1])
+                    schedule.setdefault(key, []).append(chat_id)
+        return schedule
+
+    def get_nudge_schedule(self) -> Dict[Tuple[str, str], List[int]]:
+        """Get the users due private nudges, by (timezone, 'HH:MM')
+
+        These are group participants with a private chat with the bot. Users
+        without their own settings get config.TIMEZONE and the afternoon
+        reminder time, which are always present.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
         cursor.execute('''
-            INSERT OR REPLACE INTO users (user_id, name)
-            VALUES (?, ?)
-        ''', (user_id, name))
+            SELECT u.user_id, u.timezone, u.reminder_time
+            FROM users u
+            JOIN chats p ON p.chat_id = u.user_id AND p.chat_type = 'private'
+            WHERE EXISTS (
+                SELECT 1
+                FROM chat_members m
+                JOIN chats g ON g.chat_id = m.chat_id
+                WHERE m.user_id = u.user_id AND g.chat_type IN (SELECT value FROM json_each(?))
+            )
+        ''', (json.dumps(GROUP_CHAT_TYPES),))
+
+        default = (config.TIMEZONE.zone, config.AFTERNOON_TIME)
+        schedule = {default: []}
+        for user_id, timezone, reminder_time in cursor.fetchall():
+            key = (timezone or default[0], reminder_time or default[1])
+            schedule.setdefault(key, []).append(user_id)
+        return schedule
+
+    def get_unreachable_members(self, chat_ids: List[int]) -> Dict[int, List[int]]:
+        """Get the participants of chats who have no private chat with the bot
 
-        # Initialize streak if not exists
+        They cannot be nudged privately. Returns {chat_id: [user_id, ...]}
+        for the chats that have any.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
         cursor.execute('''
-            INSERT OR IGNORE INTO streaks (user_id, current_streak, best_streak)
-            VALUES (?, 0, 0)
-        ''', (user_id,))
+            SELECT m.chat_id, m.user_id
+            FROM chat_members m
+            WHERE m.chat_id IN (SELECT value FROM json_each(?))
+              AND NOT EXISTS (
+                  SELECT 1 FROM chats p WHERE p.chat_id = m.user_id AND p.chat_type = 'private'
+              )
+        ''', (json.dumps(chat_ids),))
 
-        conn.commit()
-        conn.close()
+        members: Dict[int, List[int]] = {}
+        for chat_id, user_id in cursor.fetchall():
+            members.setdefault(chat_id, []).append(user_id)
+        return members
+
+    def _get_members(self, chat_id: int) -> Dict[int, int]:
+        """Get the cached {user_id: member_index} of a chat, in member order"""
+        with self._cache_lock:
+            members = self._chat_members.get(chat_id)
+            if members is not None:
+                self._cache_hits += 1
+                return members
 
-    def get_user_name(self, user_id: int) -> str:
-        """Get user's name from database"""
         conn = self.get_connection()
         cursor = conn.cursor()
+        cursor.execute('''
+            SELECT user_id, member_index
+            FROM chat_members
+            WHERE chat_id = ?
+            ORDER BY member_index
+        ''', (chat_id,))
+        members = dict(cursor.fetchall())
 
-        cursor.execute('SELECT name FROM users WHERE user_id = ?', (user_id,))
-        result = cursor.fetchone()
-        conn.close()
+        with self._cache_lock:
+            self._cache_misses += 1
+            self._chat_members[chat_id] = members
+            self._chat_member_ids[chat_id] = {index: user_id for user_id, index in members.items()}
+            self._chat_member_order[chat_id] = list(members)
+            return members
 
-        if result:
-            return result[0]
-        return f"User {user_id}"
+    def add_member(self, chat_id: int, user_id: int) -> bool:
+        """Add a user to a chat's participants
+
+        Known members are skipped without any write.
+        Returns True if the database was written.
+        """
+        if user_id in self._get_members(chat_id):
+            return False
 
-    def get_all_users(self) -> Dict[int, str]:
-        """Get all users as dict {user_id: name}"""
         conn = self.get_connection()
         cursor = conn.cursor()
 
-        cursor.execute('SELECT user_id, name FROM users')
-        results = cursor.fetchall()
-        conn.close()
+        with conn:
+            cursor.execute('''
+                INSERT INTO chat_members (chat_id, user_id, member_index)
+                VALUES (?, ?, (
+                    SELECT COALESCE(MAX(member_index) + 1, 0)
+                    FROM chat_members WHERE chat_id = ?
+                ))
+                ON CONFLICT (chat_id, user_id) DO NOTHING
+            ''', (chat_id, user_id, chat_id))
+            cursor.execute('''
+                SELECT member_index FROM chat_members WHERE chat_id = ? AND user_id = ?
+            ''', (chat_id, user_id))
+            member_index = cursor.fetchone()[0]
+
+        with self._cache_lock:
+            self._chat_members[chat_id][user_id] = member_index
+            self._chat_member_ids[chat_id][member_index] = user_id
+            # New members get the highest index, so the list stays in order
+            self._chat_member_order[chat_id].append(user_id)
+
+        return True
+
+    def get_chat_members(self, chat_id: int) -> Dict[int, str]:
+        """Get a chat's participants as dict {user_id: name}, in member order"""
+        names = self._get_user_names()
+        members = self._get_members(chat_id)
+        with self._cache_lock:
+            return {user_id: names[user_id] for user_id in members if user_id in names}
+
+    def get_member_index(self, chat_id: int, user_id: int) -> Optional[int]:
+        """Get a user's participant number in a chat, as used in callback data"""
+        members = self._get_members(chat_id)
+        with self._cache_lock:
+            return members.get(user_id)
 
-        return {user_id: name for user_id, name in results}
+    def get_member_user_id(self, chat_id: int, member_index: int) -> Optional[int]:
+        """Get the chat participant with a number, or None if there is none"""
+        self._get_members(chat_id)
+        with self._cache_lock:
+            return self._chat_member_ids[chat_id].get(member_index)
+
+    def get_user_name(self, user_id: int) -> str:
+        """Get user's name from database"""
+        name = self._get_user_names().get(user_id)
+        if name:
+            return name
+        return f"User {user_id}"
+
+    def get_all_users(self) -> Dict[int, str]:
+        """Get all users as dict {user_id: name}, in join order"""
+        with self._cache_lock:
+            return dict(self._get_user_names())
 
     def mark_task(self, user_id: int, task_name: str, completed: bool = True) -> bool:
-        """Mark a task as completed or not completed for today"""
+        """Mark a task as completed or not completed for today
+
+        The day's counter, mask and streak are updated in the same
+        transaction, so no extra query is needed to tell whether the day
+        just became complete or dropped below complete.
+        Returns False for task names that are not configured.
+        """
+        bit = TASK_BITS.get(task_name)
+        if bit is None:
+            return False
+
         conn = self.get_connection()
         cursor = conn.cursor()
-        today = date.today()
+        today = self.get_today(user_id)
 
-        cursor.execute('''
-            INSERT OR REPLACE INTO completions (user_id, date, task_name, completed, completed_at)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (user_id, today, task_name, completed, datetime.now() if completed else None))
-
-        conn.commit()
-        conn.close()
+        with conn:
+            # The mask guard makes a repeated tap with the same value a no-op
+            if completed:
+                cursor.execute('''
+                    INSERT INTO daily_rollup (user_id, date, completed_count, mask)
+                    VALUES (?, ?, 1, ?)
+                    ON CONFLICT (user_id, date) DO UPDATE
+                    SET completed_count = completed_count + 1, mask = mask | excluded.mask
+                    WHERE mask & excluded.mask = 0
+                    RETURNING completed_count
+                ''', (user_id, today, bit))
+            else:
+                cursor.execute('''
+                    UPDATE daily_rollup
+                    SET completed_count = completed_count - 1, mask = mask & ~:bit
+                    WHERE user_id = :user_id AND date = :day AND mask & :bit != 0
+                    RETURNING completed_count
+                ''', {'bit': bit, 'user_id': user_id, 'day': today})
+            result = cursor.fetchone()
+            if result is None:
+                return True
 
-        # Update streak if all tasks are completed
-        if completed:
-            self.update_streak(user_id)
+            self._record_change(cursor, user_id, today, task_name, completed, result[0])
 
+        self._invalidate_user_state(user_id)
         return True
 
-    def get_today_status(self, user_id: int) -> Dict[str, bool]:
-        """Get today's completion status for a user"""
+    def toggle_task(self, user_id: int, task_name: str, day: Optional[date] = None,
+                    chat_id: Optional[int] = None) -> Optional[Dict]:
+        """Atomically flip a task for a day (the user's today by default)
+        and return the user's new state
+
+        The flip happens in SQL (mask XOR bit), so concurrent taps can never
+        both write the same value. The returned snapshot has the same keys
+        as a get_dashboard entry for chat_id (member_index is None without
+        one) and is written through to the caches, so re-rendering after a
+        toggle needs no further queries.
+        Returns None for task names that are not configured.
+        """
+        bit = TASK_BITS.get(task_name)
+        if bit is None:
+            return None
+        if day is None:
+            day = self.get_today(user_id)
+
         conn = self.get_connection()
         cursor = conn.cursor()
-        today = date.today()
 
-        cursor.execute('''
-            SELECT task_name, completed
-            FROM completions
-            WHERE user_id = ? AND date = ?
-        ''', (user_id, today))
+        with conn:
+            cursor.execute('''
+                INSERT INTO daily_rollup (user_id, date, completed_count, mask)
+                VALUES (?, ?, 1, ?)
+                ON CONFLICT (user_id, date) DO UPDATE
+                SET completed_count = completed_count
+                        + CASE WHEN mask & excluded.mask THEN -1 ELSE 1 END,
+                    -- SQLite has no XOR operator; this is mask ^ bit
+                    mask = (mask | excluded.mask) - (mask & excluded.mask)
+                RETURNING completed_count, mask
+            ''', (user_id, day, bit))
+            completed_count, mask = cursor.fetchone()
+
+            self._record_change(cursor, user_id, day, task_name, bool(mask & bit), completed_count)
+
+            cursor.execute('''
+                SELECT current_streak, best_streak
+                FROM streaks
+                WHERE user_id = ?
+            ''', (user_id,))
+            streak = cursor.fetchone() or (0, 0)
+
+        with self._cache_lock:
+            self._streaks[user_id] = streak
+            cache = self._cached_masks(day)
+            if cache is not None:
+                cache[user_id] = mask
+            self._bump_version(user_id)
+            version = self._versions[user_id]
+
+        status = mask_to_status(mask)
+        return {
+            'user_id': user_id,
+            'name': self.get_user_name(user_id),
+            'status': status,
+            'completed': sum(status.values()),
+            'streak': streak[0],
+            'best_streak': streak[1],
+            'version': version,
+            'member_index': self.get_member_index(chat_id, user_id) if chat_id is not None else None,
+            'day': day
+        }
+
+    def _record_change(self, cursor, user_id: int, day: date, task_name: str,
+                       completed: bool, completed_count: int):
+        """Apply the effects of a task changing state in the caller's transaction"""
+        if config.COMPLETIONS_LAYOUT == 'rows':
+            cursor.execute('''
+                INSERT INTO completions (user_id, date, task_name, completed, completed_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, date, task_name) DO UPDATE
+                SET completed = excluded.completed, completed_at = excluded.completed_at
+            ''', (user_id, day, task_name, completed, datetime.now() if completed else None))
+
+        total = len(self.get_daily_tasks())
+        if completed and completed_count == total:
+            self._advance_streak(cursor, user_id, day)
+        elif not completed and completed_count == total - 1:
+            self._rollback_streak(cursor, user_id, day)
+
+    def get_today_status(self, user_id: int) -> Dict[str, bool]:
+        """Get today's completion status for a user, in their timezone"""
+        return self.get_today_status_many([user_id])[user_id]
 
-        results = cursor.fetchall()
-        conn.close()
+    def get_today_status_many(self, user_ids: List[int],
+                              day: Optional[date] = None) -> Dict[int, Dict[str, bool]]:
+        """Get completion status for many users on a day in a single query
 
-        return {task: bool(completed) for task, completed in results}
+        Without a day, each user's own today is used (one query per
+        distinct date). Current masks are served from the cache; only
+        misses are queried.
+        """
+        if day is None:
+            by_day: Dict[date, List[int]] = {}
+            for user_id in user_ids:
+                by_day.setdefault(self.get_today(user_id), []).append(user_id)
+            statuses = {}
+            for user_day, day_user_ids in by_day.items():
+                statuses.update(self.get_today_status_many(day_user_ids, user_day))
+            return {user_id: statuses[user_id] for user_id in user_ids}
+
+        masks = {user_id: 0 for user_id in user_ids}
+        cache = self._cached_masks(day)
+
+        missing = list(masks)
+        if cache is not None:
+            with self._cache_lock:
+                missing = []
+                for user_id in masks:
+                    if user_id in cache:
+                        masks[user_id] = cache[user_id]
+                    else:
+                        missing.append(user_id)
+            self._count_cache(hits=len(masks) - len(missing), misses=len(missing))
+
+        if missing:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            # json_each keeps this one statement regardless of the number of users
+            cursor.execute('''
+                SELECT user_id, mask
+                FROM daily_rollup
+                WHERE date = ? AND user_id IN (SELECT value FROM json_each(?))
+            ''', (day, json.dumps(missing)))
+
+            for user_id, mask in cursor.fetchall():
+                masks[user_id] = mask
+
+            if cache is not None:
+                with self._cache_lock:
+                    for user_id in missing:
+                        cache[user_id] = masks[user_id]
+
+        return {user_id: mask_to_status(mask) for user_id, mask in masks.items()}
+
+    def get_streaks_many(self, user_ids: List[int]) -> Dict[int, Tuple[int, int]]:
+        """Get (current, best) streaks for many users, querying only cache misses"""
+        streaks = {}
+        missing = []
+        with self._cache_lock:
+            for user_id in user_ids:
+                if user_id in self._streaks:
+                    streaks[user_id] = self._streaks[user_id]
+                else:
+                    missing.append(user_id)
+        self._count_cache(hits=len(streaks), misses=len(missing))
+
+        if missing:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT user_id, current_streak, best_streak
+                FROM streaks
+                WHERE user_id IN (SELECT value FROM json_each(?))
+            ''', (json.dumps(missing),))
+            loaded = {user_id: (current, best) for user_id, current, best in cursor.fetchall()}
+
+            with self._cache_lock:
+                for user_id in missing:
+                    streaks[user_id] = self._streaks[user_id] = loaded.get(user_id, (0, 0))
+
+        return streaks
+
+    def get_dashboard(self, chat_id: int, user_ids: Optional[List[int]] = None,
+                      day: Optional[date] = None) -> List[Dict]:
+        """Get names, streaks and day status for a chat's participants
+
+        Returns one dict per user, in member order or in the order of
+        user_ids, with the keys user_id, name, status, completed, streak,
+        best_streak, version (see get_state_version), member_index and day.
+        The day defaults to the chat's today (see get_timezone).
+        If user_ids is None, every participant of the chat is included;
+        users who are not participants are always left out.
+        Everything is read through the caches, so at most two queries run.
+        """
+        if day is None:
+            day = self.get_today(chat_id=chat_id)
+        names = self._get_user_names()
+        members = self._get_members(chat_id)
+        with self._cache_lock:
+            if user_ids is None:
+                user_ids = list(members)
+            else:
+                user_ids = list(dict.fromkeys(user_ids))
+            user_ids = [user_id for user_id in user_ids if user_id in members and user_id in names]
+            names = {user_id: names[user_id] for user_id in user_ids}
+            member_index = {user_id: members[user_id] for user_id in user_ids}
+
+            # Versions are read first, so a concurrent write can only make the
+            # snapshot newer than its version, never older
+            versions = {user_id: self._versions.get(user_id, 0) for user_id in user_ids}
+
+        statuses = self.get_today_status_many(user_ids, day)
+        streaks = self.get_streaks_many(user_ids)
+        task_ids = self.get_daily_tasks()
+
+        dashboard = []
+        for user_id in user_ids:
+            status = statuses[user_id]
+            streak, best_streak = streaks[user_id]
+            dashboard.append({
+                'user_id': user_id,
+                'name': names[user_id],
+                'status': status,
+                'completed': sum(1 for task_id in task_ids if status.get(task_id, False)),
+                'streak': streak,
+                'best_streak': best_streak,
+                'version': versions[user_id],
+                'member_index': member_index[user_id],
+                'day': day
+            })
+
+        return dashboard
+
+    def get_dashboard_page(self, chat_id: int, page: int, page_size: int,
+                           day: Optional[date] = None) -> Dict:
+        """Get one page of a chat's dashboard
+
+        Only the users on the page are loaded, sliced from the cached
+        member order, so the cost does not depend on the page number or the
+        chat size. Returns a dict with the clamped page number, page_count,
+        total participants, the day shown and participants (get_dashboard
+        entries for the page).
+        """
+        if day is None:
+            day = self.get_today(chat_id=chat_id)
+        self._get_members(chat_id)
+        with self._cache_lock:
+            order = self._chat_member_order[chat_id]
+            total = len(order)
+            page_count = max(1, -(-total // page_size))
+            page = min(max(page, 0), page_count - 1)
+            start = page * page_size
+            user_ids = order[start:start + page_size]
+
+        return {
+            'page': page,
+            'page_count': page_count,
+            'total': total,
+            'day': day,
+            'participants': self.get_dashboard(chat_id, user_ids, day)
+        }
+
+    def get_open_task_masks(self, user_ids: List[int], day: date) -> Dict[int, int]:
+        """Find which of the users have not finished a day's tasks
+
+        One query probes each user's rollup row by primary key, so the cost
+        grows with the number of users asked about, not with the history.
+        Returns {user_id: mask of the tasks done}.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT u.value, COALESCE(r.mask, 0)
+            FROM json_each(?) u
+            LEFT JOIN daily_rollup r ON r.user_id = u.value AND r.date = ?
+            WHERE COALESCE(r.completed_count, 0) < ?
+        ''', (json.dumps(user_ids), day, len(self.get_daily_tasks())))
+        return dict(cursor.fetchall())
 
     def get_daily_tasks(self) -> List[str]:
         """Get all task names for today based on schedule"""
@@ -155,109 +1127,365 @@ class Database:
     def is_day_complete(self, user_id: int, check_date: Optional[date] = None) -> bool:
         """Check if user completed all tasks for a given day"""
         if check_date is None:
-            check_date = date.today()
+            check_date = self.get_today(user_id)
 
         conn = self.get_connection()
         cursor = conn.cursor()
 
-        # Get expected tasks for that day
-        expected_tasks = self.get_daily_tasks()
-
         cursor.execute('''
-            SELECT COUNT(*)
-            FROM completions
-            WHERE user_id = ? AND date = ? AND completed = 1
+            SELECT completed_count
+            FROM daily_rollup
+            WHERE user_id = ? AND date = ?
         ''', (user_id, check_date))
+        result = cursor.fetchone()
 
-        completed_count = cursor.fetchone()[0]
-        conn.close()
+        return result is not None and result[0] >= len(self.get_daily_tasks())
 
-        return completed_count >= len(expected_tasks)
+    def _advance_streak(self, cursor, user_id: int, day: date):
+        """Extend or restart the streak when a day becomes complete
 
-    def update_streak(self, user_id: int):
-        """Update user's streak based on completion history"""
+        A day before the last completed one leaves the streak alone. That
+        happens when a user ticks days by two clocks, e.g. a group in a
+        timezone ahead of their own, and must not restart the streak.
+        """
+        cursor.execute('''
+            UPDATE streaks
+            SET prev_streak = current_streak,
+                prev_best_streak = best_streak,
+                prev_completion_date = last_completion_date,
+                current_streak = CASE
+                    WHEN last_completion_date = date(:day, '-1 day') THEN current_streak + 1
+                    WHEN last_completion_date = :day THEN current_streak
+                    ELSE 1
+                END,
+                last_completion_date = :day
+            WHERE user_id = :user_id
+              AND (last_completion_date IS NULL OR last_completion_date <= :day)
+        ''', {'day': day, 'user_id': user_id})
+        # Assignments above all see the old row, so best is updated separately
+        cursor.execute('''
+            UPDATE streaks
+            SET best_streak = MAX(best_streak, current_streak)
+            WHERE user_id = ?
+        ''', (user_id,))
+
+    def _rollback_streak(self, cursor, user_id: int, day: date):
+        """Undo the streak advance when a completed day drops below complete"""
+        cursor.execute('''
+            UPDATE streaks
+            SET current_streak = prev_streak,
+                best_streak = prev_best_streak,
+                last_completion_date = prev_completion_date
+            WHERE user_id = ? AND last_completion_date = ?
+        ''', (user_id, day))
+
+    def get_streak(self, user_id: int) -> Tuple[int, int]:
+        """Get current and best streak for user"""
+        return self.get_streaks_many([user_id])[user_id]
+
+    def get_week_stats(self, user_id: int) -> Dict[str, int]:
+        """Get weekly statistics for user"""
+        tasks = self.get_period_stats(user_id, days=7)['tasks']
+        return {task_id: count for task_id, count in tasks.items() if count}
+
+    def get_period_stats(self, user_id: int, days: Optional[int] = None) -> Dict:
+        """Get statistics for the last `days` days, or all time if None
+
+        Aggregates daily_rollup rows in one pass over the primary key, so
+        the cost is one row per tracked day regardless of the task count.
+        Returns a dict with active_days, complete_days and per-task counts.
+        """
         conn = self.get_connection()
         cursor = conn.cursor()
-        today = date.today()
 
-        # Get current streak info
-        cursor.execute('SELECT current_streak, best_streak, last_completion_date FROM streaks WHERE user_id = ?', (user_id,))
-        result = cursor.fetchone()
+        task_columns = ', '.join(f'SUM(mask & {bit} != 0)' for bit in TASK_BITS.values())
+        query = f'''
+            SELECT COUNT(*), SUM(completed_count >= ?), {task_columns}
+            FROM daily_rollup
+            WHERE user_id = ? AND completed_count > 0
+        '''
+        params = [len(self.get_daily_tasks()), user_id]
+        if days is not None:
+            query += " AND date >= ?"
+            params.append(self.get_today(user_id) - timedelta(days=days))
 
-        if not result:
-            return
+        cursor.execute(query, params)
+        active_days, complete_days, *task_counts = cursor.fetchone()
 
-        current_streak, best_streak, last_date_str = result
+        return {
+            'active_days': active_days,
+            'complete_days': complete_days or 0,
+            'tasks': {task_id: count or 0 for task_id, count in zip(TASK_BITS, task_counts)}
+        }
 
-        # Check if today is complete
-        if not self.is_day_complete(user_id, today):
-            return
+    def enqueue_messages(self, messages: Iterable[Tuple[int, str]], kind: str,
+                         day: Optional[date] = None, parse_mode: Optional[str] = None) -> int:
+        """Queue (chat_id, text) messages, once per (chat, kind, date)
 
-        # Parse last completion date
-        if last_date_str:
-            last_date = datetime.strptime(last_date_str, '%Y-%m-%d').date()
-            days_diff = (today - last_date).days
-
-            if days_diff == 1:
-                # Continue streak
-                current_streak += 1
-            elif days_diff == 0:
-                # Same day, no change
-                pass
-            else:
-                # Streak broken, restart
-                current_streak = 1
-        else:
-            # First completion
-            current_streak = 1
+        Chats that already have this message queued or sent are skipped.
+        Returns the number of messages queued.
+        """
+        day = day or local_today()
+        conn = self.get_connection()
+        with conn:
+            cursor = conn.executemany('''
+                INSERT INTO outbox (chat_id, kind, date, text, parse_mode)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (chat_id, kind, date) DO NOTHING
+            ''', ((chat_id, kind, day, text, parse_mode) for chat_id, text in messages))
+            return cursor.rowcount
+
+    def enqueue_edit(self, chat_id: int, message_id: int, text: str,
+                     reply_markup: Optional[str] = None, parse_mode: Optional[str] = None):
+        """Queue an edit of a message, replacing any queued edit of the same message"""
+        conn = self.get_connection()
+        with conn:
+            conn.execute('''
+                INSERT INTO outbox (chat_id, kind, date, text, parse_mode, reply_markup, message_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (chat_id, kind, date) DO UPDATE
+                SET text = excluded.text, parse_mode = excluded.parse_mode,
+                    reply_markup = excluded.reply_markup, status = 'pending',
+                    attempts = 0, next_attempt_at = 0, last_error = NULL
+            ''', (chat_id, f'edit:{message_id}', local_today(), text, parse_mode,
+                  reply_markup, message_id))
 
-        # Update best streak
-        best_streak = max(best_streak, current_streak)
+    def cancel_edit(self, chat_id: int, message_id: int) -> int:
+        """Drop queued edits of a message that has since been edited directly
+
+        Returns the number of edits dropped.
+        """
+        conn = self.get_connection()
+        with conn:
+            return conn.execute('''
+                DELETE FROM outbox
+                WHERE chat_id = ? AND kind = ? AND status = 'pending'
+            ''', (chat_id, f'edit:{message_id}')).rowcount
 
+    def get_due_messages(self, now: float, limit: int) -> List[Dict]:
+        """Get pending outbox messages whose next attempt is due, oldest first"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
         cursor.execute('''
-            UPDATE streaks
-            SET current_streak = ?, best_streak = ?, last_completion_date = ?
-            WHERE user_id = ?
-        ''', (current_streak, best_streak, today, user_id))
+            SELECT id, chat_id, kind, text, parse_mode, reply_markup, message_id, attempts
+            FROM outbox
+            WHERE status = 'pending' AND next_attempt_at <= ?
+            ORDER BY next_attempt_at
+            LIMIT ?
+        ''', (now, limit))
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
 
-        conn.commit()
-        conn.close()
+    def get_next_attempt_at(self) -> Optional[float]:
+        """Get when the earliest pending outbox message is due, if any"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT MIN(next_attempt_at) FROM outbox WHERE status = 'pending'")
+        return cursor.fetchone()[0]
 
-    def get_streak(self, user_id: int) -> Tuple[int, int]:
-        """Get current and best streak for user"""
+    def finish_messages(self, sent: Iterable[int] = (),
+                        retry: Iterable[Tuple[int, float, str]] = (),
+                        failed: Iterable[Tuple[int, str]] = ()):
+        """Record delivery results for outbox messages
+
+        sent holds message IDs, retry (id, next_attempt_at, error) tuples and
+        failed (id, error) tuples for messages that are given up on.
+        """
+        conn = self.get_connection()
+        with conn:
+            conn.executemany(
+                "UPDATE outbox SET status = 'sent', attempts = attempts + 1 WHERE id = ?",
+                ((message_id,) for message_id in sent)
+            )
+            conn.executemany('''
+                UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ?
+                WHERE id = ?
+            ''', ((next_at, error, message_id) for message_id, next_at, error in retry))
+            conn.executemany('''
+                UPDATE outbox SET status = 'failed', attempts = attempts + 1, last_error = ?
+                WHERE id = ?
+            ''', ((error, message_id) for message_id, error in failed))
+
+    def prune_outbox(self, keep_days: int) -> Tuple[int, int]:
+        """Expire pending messages from past days and delete old finished ones
+
+        Returns (expired, deleted) row counts.
+        """
+        # A day is over everywhere only once it is two UTC days old
+        cutoff = utc_today() - timedelta(days=1)
+        conn = self.get_connection()
+        with conn:
+            expired = conn.execute('''
+                UPDATE outbox SET status = 'expired'
+                WHERE status = 'pending' AND date < ?
+            ''', (cutoff,)).rowcount
+            deleted = conn.execute('''
+                DELETE FROM outbox
+                WHERE status != 'pending' AND date < ?
+            ''', (cutoff - timedelta(days=keep_days),)).rowcount
+        return expired, deleted
+
+    def get_outbox_stats(self) -> Dict[str, int]:
+        """Count outbox messages by status"""
         conn = self.get_connection()
         cursor = conn.cursor()
+        cursor.execute('SELECT status, COUNT(*) FROM outbox GROUP BY status')
+        return dict(cursor.fetchall())
 
-        cursor.execute('SELECT current_streak, best_streak FROM streaks WHERE user_id = ?', (user_id,))
-        result = cursor.fetchone()
-        conn.close()
+    def add_review_cards(self, cards: Iterable[Tuple[int, str, int, int, str]], day: date) -> int:
+        """Create review cards due on day from (user_id, plan, plan_day, item, phrase)
 
-        if result:
-            return result
-        return (0, 0)
+        Cards a user already has are left alone. Returns the number created.
+        """
+        conn = self.get_connection()
+        with conn:
+            cursor = conn.executemany('''
+                INSERT INTO review_cards (user_id, plan, plan_day, item, phrase, ease, due)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, plan, plan_day, item) DO NOTHING
+            ''', ((*card, INITIAL_EASE, day.toordinal()) for card in cards))
+        return cursor.rowcount
 
-    def get_week_stats(self, user_id: int) -> Dict[str, int]:
-        """Get weekly statistics for user"""
+    def get_next_review(self, user_id: int, day: date) -> Optional[Dict]:
+        """Get the user's most overdue card due by day, or None
+
+        One probe of the due queue index.
+        """
         conn = self.get_connection()
         cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT {', '.join(REVIEW_CARD_FIELDS)}
+            FROM review_cards
+            WHERE user_id = ? AND due <= ?
+            ORDER BY due, card_id
+            LIMIT 1
+        ''', (user_id, day.toordinal()))
+        row = cursor.fetchone()
+        return dict(zip(REVIEW_CARD_FIELDS, row)) if row else None
 
+    def record_review(self, user_id: int, card_id: int, grade: Grade, day: date) -> Optional[Dict]:
+        """Grade a user's card reviewed on day and move it along the due queue
+
+        Returns the updated card, or None if the user has no such card.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        with conn:
+            cursor.execute(f'''
+                SELECT {', '.join(REVIEW_CARD_FIELDS)}
+                FROM review_cards
+                WHERE card_id = ? AND user_id = ?
+            ''', (card_id, user_id))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            card = dict(zip(REVIEW_CARD_FIELDS, row))
+
+            ease, interval, repetitions = schedule_review(card, grade)
+            card.update(
+                ease=ease, interval_days=interval, repetitions=repetitions,
+                lapses=card['lapses'] + (repetitions == 0), due=day.toordinal() + interval
+            )
+            cursor.execute('''
+                UPDATE review_cards
+                SET ease = ?, interval_days = ?, repetitions = ?, lapses = ?, due = ?,
+                    reviewed_at = CURRENT_TIMESTAMP
+                WHERE card_id = ?
+            ''', (ease, interval, repetitions, card['lapses'], card['due'], card_id))
+        return card
+
+    def get_review_stats(self, user_id: int, day: date) -> Dict[str, int]:
+        """Count a user's cards: total, due by day, and learned (recalled at least once)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
         cursor.execute('''
-            SELECT task_name, COUNT(*)
-            FROM completions
+            SELECT COUNT(*),
+                   COALESCE(SUM(due <= ?), 0),
+                   COALESCE(SUM(repetitions > 0), 0),
+                   MIN(CASE WHEN due > ? THEN due END)
+            FROM review_cards
             WHERE user_id = ?
-            AND date >= date('now', '-7 days')
-            AND completed = 1
-            GROUP BY task_name
-        ''', (user_id,))
+        ''', (day.toordinal(), day.toordinal(), user_id))
+        total, due, learned, next_due = cursor.fetchone()
+        return {'total': total, 'due': due, 'learned': learned, 'next_due': next_due}
+
+    def get_reviewer_ids(self) -> List[int]:
+        """Get the users who have review cards"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT DISTINCT user_id FROM review_cards')
+        return [row[0] for row in cursor.fetchall()]
+
+    def spread_reviews(self, day: date, daily_limit: int) -> int:
+        """Spread every user's backlog so at most daily_limit cards fall due per day
+
+        Cards due by day beyond each user's first daily_limit (most overdue
+        first) move to the following days, in one statement over all users.
+        Returns the number of cards moved.
+        """
+        conn = self.get_connection()
+        with conn:
+            conn.execute('''
+                WITH backlog AS (
+                    SELECT card_id,
+                           ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY due, card_id) - 1 AS position
+                    FROM review_cards
+                    WHERE due <= :day
+                )
+                UPDATE review_cards
+                SET due = :day + backlog.position / :limit
+                FROM backlog
+                WHERE review_cards.card_id = backlog.card_id AND backlog.position >= :limit
+            ''', {'day': day.toordinal(), 'limit': daily_limit})
+            # rowcount is not set for statements starting with WITH
+            moved = conn.execute('SELECT changes()').fetchone()[0]
+        return moved
+
 
-        results = cursor.fetchall()
-        conn.close()
+class AsyncDatabase:
+    """Awaitable facade over Database for use from async handlers
+
+    Calls are queued to a single dedicated worker thread, so SQLite I/O never
+    blocks the event loop and writes are serialized on that thread's pooled
+    connection. Every public Database method is available as a coroutine
+    with the same arguments and results.
+    """
+
+    def __init__(self, database: Database):
+        self._db = database
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-worker')
+
+    async def run(self, func, *args, **kwargs):
+        """Run a callable on the DB worker thread and await its result"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    def __getattr__(self, name):
+        attr = getattr(self._db, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+
+        return call
+
+    def shutdown(self):
+        """Wait for queued calls and stop the worker thread"""
+        self._executor.shutdown(wait=True)
 
-        return {task: count for task, count in results}
 
 # Initialize database
 db = Database()
+adb = AsyncDatabase(db)
+
+# Register the configured group chat
+if config.GROUP_CHAT_ID and db.get_chat(config.GROUP_CHAT_ID) is None:
+    db.add_chat(config.GROUP_CHAT_ID)
 
 # Add preconfigured users from config
 for user_id, name in config.STUDY_BUDDIES.items():
     db.add_user(user_id, name)
+    if config.GROUP_CHAT_ID:
+        db.add_member(config.GROUP_CHAT_ID, user_id)
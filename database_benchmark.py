@@ -0,0 +1,190 @@
+"""
+Local benchmarks of the database layer
+loop: how late the event loop runs while hundreds of checklist toggles
+are in flight, awaited through AsyncDatabase or called synchronously
+layouts: file size, query and toggle timings of the rows and bitmask
+completion layouts on years of synthetic history
+
+    python database_benchmark.py loop [toggles] [users]
+    python database_benchmark.py layouts [years] [users]
+
+Each run builds its databases from scratch, so results do not depend on
+the state of any earlier run.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+from benchmark_support import percentile, use_throwaway_database
+
+use_throwaway_database()
+
+import config
+from database import TASK_BITS, AsyncDatabase, Database, local_today
+
+# How often the lag probe wakes up
+PROBE_INTERVAL = 0.005
+
+
+async def _probe_lag(lags: List[float], stop: asyncio.Event):
+    """Record how much later than asked each probe sleep wakes up"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(time.perf_counter() - started - PROBE_INTERVAL)
+
+
+async def _measure_loop(database: Database, toggles: int, users: int, awaited: bool) -> Dict:
+    """Toggle tasks concurrently while probing the event loop's lag"""
+    adb = AsyncDatabase(database)
+    task_names = list(TASK_BITS)
+    lags: List[float] = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_probe_lag(lags, stop))
+    await asyncio.sleep(PROBE_INTERVAL * 2)
+
+    async def toggle(i: int):
+        user_id, task_name = 1 + i % users, task_names[i % len(task_names)]
+        if awaited:
+            await adb.toggle_task(user_id, task_name)
+        else:
+            # What a handler calling the sync db directly does
+            database.toggle_task(user_id, task_name)
+            await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(toggle(i) for i in range(toggles)))
+    seconds = time.perf_counter() - started
+    stop.set()
+    await probe
+    adb.shutdown()
+
+    return {
+        'toggles_per_second': round(toggles / seconds, 1),
+        'probes': len(lags),
+        'lag_p50_ms': round(percentile(lags, 0.5) * 1000, 2),
+        'lag_p99_ms': round(percentile(lags, 0.99) * 1000, 2),
+        'lag_max_ms': round(max(lags) * 1000, 2),
+    }
+
+
+def benchmark(toggles: int = 500, users: int = 50) -> Dict:
+    """Compare event loop lag of awaited and blocking toggles
+
+    All toggles start at once. Blocking calls are faster end to end, since
+    they skip the hop to the worker thread, but hold the loop for as long
+    as they run; awaited ones leave it free between submissions.
+    """
+    database = Database(os.path.join(tempfile.mkdtemp(), 'loop.db'))
+    for user_id in range(1, users + 1):
+        database.add_user(user_id, f'User {user_id}')
+
+    results = {'toggles': toggles, 'users': users}
+    for variant, awaited in (('async', True), ('sync', False)):
+        results[variant] = asyncio.run(_measure_loop(database, toggles, users, awaited))
+    database.close()
+    return results
+
+
+def _fill_history(database: Database, layout: str, years: int, users: int):
+    """Write years of history for users, each task done on about 70% of days"""
+    rng = random.Random(1)
+    first_day = local_today() - timedelta(days=365 * years)
+    rollup, completions = [], []
+    for user_id in range(1, users + 1):
+        database.add_user(user_id, f'User {user_id}')
+        for offset in range(365 * years):
+            day = first_day + timedelta(days=offset)
+            done = [task_name for task_name in TASK_BITS if rng.random() < 0.7]
+            if not done:
+                continue
+            rollup.append((user_id, day, len(done), sum(TASK_BITS[task_name] for task_name in done)))
+            if layout == 'rows':
+                completed_at = datetime.combine(day, datetime.min.time())
+                completions.extend((user_id, day, task_name, True, completed_at) for task_name in done)
+
+    conn = database.get_connection()
+    with conn:
+        conn.executemany(
+            'INSERT INTO daily_rollup (user_id, date, completed_count, mask) VALUES (?, ?, ?, ?)', rollup
+        )
+        conn.executemany('''
+            INSERT INTO completions (user_id, date, task_name, completed, completed_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', completions)
+    conn.execute('ANALYZE')
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+
+def _time_calls(calls: int, call: Callable[[int], object]) -> float:
+    """Run call(i) for i in range(calls) and get the mean microseconds per call"""
+    started = time.perf_counter()
+    for i in range(calls):
+        call(i)
+    return round((time.perf_counter() - started) / calls * 1e6, 1)
+
+
+def benchmark_layouts(years: int = 3, users: int = 20, calls: int = 500) -> Dict:
+    """Compare the completion layouts on the same synthetic history
+
+    Reads go through daily_rollup in both layouts, so they should time the
+    same; the layouts differ in file size and in what a toggle writes.
+    """
+    results = {'years': years, 'users': users}
+    configured = config.COMPLETIONS_LAYOUT
+    try:
+        for layout in ('rows', 'bitmask'):
+            # Database reads the layout when it opens and on every write
+            config.COMPLETIONS_LAYOUT = layout
+            path = os.path.join(tempfile.mkdtemp(), f'{layout}.db')
+            database = Database(path)
+            started = time.perf_counter()
+            _fill_history(database, layout, years, users)
+            fill_seconds = time.perf_counter() - started
+
+            rng = random.Random(2)
+            user_ids = list(range(1, users + 1))
+            days = [local_today() - timedelta(days=rng.randrange(2, 365 * years)) for _ in range(calls)]
+            task_names = list(TASK_BITS)
+            results[layout] = {
+                'fill_seconds': round(fill_seconds, 2),
+                'file_kb': round(os.path.getsize(path) / 1024, 1),
+                'completions_rows': database.get_connection().execute(
+                    'SELECT COUNT(*) FROM completions').fetchone()[0],
+                'period_stats_all_us': _time_calls(
+                    calls, lambda i: database.get_period_stats(1 + i % users)),
+                'period_stats_week_us': _time_calls(
+                    calls, lambda i: database.get_period_stats(1 + i % users, days=7)),
+                'day_complete_us': _time_calls(
+                    calls, lambda i: database.is_day_complete(1 + i % users, days[i])),
+                'day_status_all_users_us': _time_calls(
+                    calls, lambda i: database.get_today_status_many(user_ids, days[i])),
+                'toggle_us': _time_calls(
+                    calls, lambda i: database.toggle_task(1 + i % users, task_names[i % len(task_names)],
+                                                          days[i])),
+            }
+            database.close()
+    finally:
+        config.COMPLETIONS_LAYOUT = configured
+    return results
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    if sys.argv[1:2] == ['loop']:
+        count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+        user_count = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+        print(benchmark(count, user_count))
+    elif sys.argv[1:2] == ['layouts']:
+        year_count = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+        user_count = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+        print(benchmark_layouts(year_count, user_count))
+    else:
+        print(__doc__)
@@ -0,0 +1,160 @@
+"""
+Coalesced, diff-aware edits of bot messages
+Rapid taps on the same message are debounced into a single edit of the
+latest render, and edits that would not change the message are skipped
+"""
+
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from telegram import InlineKeyboardMarkup
+from telegram.error import BadRequest, RetryAfter
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Coroutine function returning the current (text, keyboard) of a message
+Render = Callable[[], Awaitable[Tuple[str, Optional[InlineKeyboardMarkup]]]]
+
+MessageKey = Tuple[int, int]
+
+# Coroutine function taking over an edit that could not be sent:
+# (chat_id, message_id, text, keyboard)
+Fallback = Callable[[int, int, str, Optional[InlineKeyboardMarkup]], Awaitable[None]]
+
+# Coroutine function dropping whatever the fallback still holds for a
+# message once a newer render was sent: (chat_id, message_id)
+CancelFallback = Callable[[int, int], Awaitable[None]]
+
+
+def render_hash(text: str, keyboard: Optional[InlineKeyboardMarkup]) -> str:
+    """Hash a rendered message so identical renders can be detected"""
+    digest = hashlib.blake2b(text.encode(), digest_size=16)
+    if keyboard is not None:
+        digest.update(keyboard.to_json().encode())
+    return digest.hexdigest()
+
+
+class EditCoalescer:
+    """Per-message edit debouncer
+
+    Each request_edit stores the message's render function. After the
+    debounce window the latest one is rendered once and sent, unless its
+    hash matches what the message already shows. Edits that fail for
+    transient reasons are handed to the fallback, if any, and taken back
+    with cancel_fallback when a later edit of the message goes through.
+    """
+
+    def __init__(self, delay: float = config.EDIT_DEBOUNCE_SECONDS, max_tracked: int = 1024,
+                 fallback: Optional[Fallback] = None, cancel_fallback: Optional[CancelFallback] = None):
+        self.delay = delay
+        self.fallback = fallback
+        self.cancel_fallback = cancel_fallback
+        self.max_tracked = max_tracked
+        self._pending: Dict[MessageKey, Tuple[object, Render]] = {}
+        self._workers: Dict[MessageKey, asyncio.Task] = {}
+        self._shown: OrderedDict = OrderedDict()
+        self._stats = {'requested': 0, 'sent': 0, 'coalesced': 0, 'unchanged': 0, 'failed': 0}
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get edit counters; coalesced + unchanged is the number of edits saved"""
+        return dict(self._stats, saved=self._stats['coalesced'] + self._stats['unchanged'])
+
+    def remember(self, chat_id: int, message_id: int, text: str,
+                 keyboard: Optional[InlineKeyboardMarkup]):
+        """Record what a freshly sent message shows, so no-op edits are skipped"""
+        self._remember((chat_id, message_id), render_hash(text, keyboard))
+
+    def _remember(self, key: MessageKey, content_hash: str):
+        self._shown[key] = content_hash
+        self._shown.move_to_end(key)
+        while len(self._shown) > self.max_tracked:
+            self._shown.popitem(last=False)
+
+    async def request_edit(self, bot, chat_id: int, message_id: int, render: Render):
+        """Schedule an edit of a message with the render available after the window"""
+        key = (chat_id, message_id)
+        self._stats['requested'] += 1
+        if key in self._pending:
+            self._stats['coalesced'] += 1
+        self._pending[key] = (bot, render)
+
+        if key not in self._workers:
+            self._workers[key] = asyncio.create_task(self._run(key))
+
+    async def _run(self, key: MessageKey):
+        """Flush a message's pending edits until none arrive during a flush"""
+        try:
+            while key in self._pending:
+                await asyncio.sleep(self.delay)
+                bot, render = self._pending.pop(key)
+                try:
+                    await self._send(key, bot, render)
+                except Exception as e:
+                    self._stats['failed'] += 1
+                    logger.error(f"Error rendering edit for {key}: {e}")
+        finally:
+            self._workers.pop(key, None)
+
+    async def _send(self, key: MessageKey, bot, render: Render):
+        """Render and send one edit, skipping it if nothing changed"""
+        text, keyboard = await render()
+        content_hash = render_hash(text, keyboard)
+        if self._shown.get(key) == content_hash:
+            self._stats['unchanged'] += 1
+            return
+
+        chat_id, message_id = key
+        retryable = False
+        for attempt in range(2):
+            try:
+                await bot.edit_message_text(
+                    chat_id=chat_id,
+                    message_id=message_id,
+                    text=text,
+                    reply_markup=keyboard,
+                    parse_mode='Markdown'
+                )
+                self._stats['sent'] += 1
+                await self._shown_now(key, content_hash)
+                return
+            except RetryAfter as e:
+                if attempt:
+                    retryable = True
+                    break
+                logger.warning(f"Flood control on edit of {key}, retrying in {e.retry_after}s")
+                await asyncio.sleep(e.retry_after)
+            except BadRequest as e:
+                if 'not modified' in str(e).lower():
+                    self._stats['unchanged'] += 1
+                    await self._shown_now(key, content_hash)
+                    return
+                logger.error(f"Error editing message: {e}")
+                retryable = False
+                break
+            except Exception as e:
+                logger.error(f"Error editing message: {e}")
+                retryable = True
+                break
+
+        self._stats['failed'] += 1
+        if retryable and self.fallback is not None:
+            await self.fallback(chat_id, message_id, text, keyboard)
+
+    async def _shown_now(self, key: MessageKey, content_hash: str):
+        """Record a render the message now shows and drop older handed-off edits"""
+        self._remember(key, content_hash)
+        if self.cancel_fallback is not None:
+            try:
+                await self.cancel_fallback(*key)
+            except Exception as e:
+                logger.error(f"Error cancelling queued edit of {key}: {e}")
+
+    async def flush(self):
+        """Wait for all scheduled edits to be sent"""
+        while self._workers:
+            await asyncio.gather(*list(self._workers.values()), return_exceptions=True)
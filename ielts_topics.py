@@ -1,746 +1,74 @@
 """
 IELTS 30-Day Topic-Related Vocabulary Plan
-Each day has a specific topic with key vocabulary and phrases
+Each day has a specific topic with key vocabulary and phrases. The plans
+themselves live in plans/ and are loaded by plan_packs
 """
 
 from datetime import datetime, date
-from typing import Dict, Tuple
-
-# 30-day IELTS vocabulary plan
-# Format: day_number: (topic_name, category, key_vocabulary)
-TOPICS_PLAN = {
-    # WEEK 1 – Personal Topics
-    1: {
-        "name": "Family",
-        "category": "Personal Topics",
-        "week": 1,
-        "key_areas": [
-            "Family relationships and structures",
-            "Describing family members",
-            "Family activities and traditions",
-            "Modern family issues"
-        ],
-        "vocabulary": [
-            "nuclear family",
-            "extended family",
-            "single-parent family",
-            "close-knit family",
-            "family bond",
-            "blood relative",
-            "breadwinner",
-            "upbringing",
-            "generation gap",
-            "family values"
-        ]
-    },
-    2: {
-        "name": "Education",
-        "category": "Personal Topics",
-        "week": 1,
-        "key_areas": [
-            "Education systems",
-            "Learning methods",
-            "Academic achievement",
-            "Educational institutions"
-        ],
-        "vocabulary": [
-            "compulsory education",
-            "curriculum",
-            "academic performance",
-            "distance learning",
-            "hands-on experience",
-            "practical skills",
-            "theoretical knowledge",
-            "lifelong learning",
-            "critical thinking",
-            "educational attainment"
-        ]
-    },
-    3: {
-        "name": "Work / Career",
-        "category": "Personal Topics",
-        "week": 1,
-        "key_areas": [
-            "Job types and sectors",
-            "Career development",
-            "Work-life balance",
-            "Employment challenges"
-        ],
-        "vocabulary": [
-            "career prospects",
-            "job satisfaction",
-            "work-life balance",
-            "professional development",
-            "job security",
-            "competitive salary",
-            "career advancement",
-            "flexible working hours",
-            "job market",
-            "unemployment rate"
-        ]
-    },
-    4: {
-        "name": "Hobbies / Leisure",
-        "category": "Personal Topics",
-        "week": 1,
-        "key_areas": [
-            "Types of hobbies",
-            "Benefits of leisure activities",
-            "Indoor and outdoor activities",
-            "Free time management"
-        ],
-        "vocabulary": [
-            "leisure activities",
-            "recreational pursuits",
-            "spare time",
-            "pastime",
-            "physical exercise",
-            "mental stimulation",
-            "stress relief",
-            "social interaction",
-            "creative outlet",
-            "time-consuming"
-        ]
-    },
-    5: {
-        "name": "Food",
-        "category": "Personal Topics",
-        "week": 1,
-        "key_areas": [
-            "Food preferences and diet",
-            "Cooking and eating habits",
-            "Food culture",
-            "Health and nutrition"
-        ],
-        "vocabulary": [
-            "balanced diet",
-            "nutritious food",
-            "processed food",
-            "organic produce",
-            "eating habits",
-            "culinary traditions",
-            "fast food",
-            "home-cooked meals",
-            "food security",
-            "dietary requirements"
-        ]
-    },
-    6: {
-        "name": "Health",
-        "category": "Personal Topics",
-        "week": 1,
-        "key_areas": [
-            "Physical and mental health",
-            "Healthcare systems",
-            "Healthy lifestyle",
-            "Common health issues"
-        ],
-        "vocabulary": [
-            "physical fitness",
-            "mental well-being",
-            "preventive care",
-            "medical treatment",
-            "healthcare system",
-            "healthy lifestyle",
-            "sedentary lifestyle",
-            "chronic disease",
-            "life expectancy",
-            "health insurance"
-        ]
-    },
-    7: {
-        "name": "Technology",
-        "category": "Personal Topics",
-        "week": 1,
-        "key_areas": [
-            "Modern technology",
-            "Digital devices",
-            "Impact on daily life",
-            "Technology in communication"
-        ],
-        "vocabulary": [
-            "technological advancement",
-            "digital revolution",
-            "cutting-edge technology",
-            "user-friendly",
-            "online platform",
-            "social media",
-            "instant communication",
-            "digital literacy",
-            "tech-savvy",
-            "technological dependence"
-        ]
-    },
-
-    # WEEK 2 – City, Society, Environment
-    8: {
-        "name": "Environment",
-        "category": "City, Society, Environment",
-        "week": 2,
-        "key_areas": [
-            "Environmental problems",
-            "Climate change",
-            "Conservation",
-            "Sustainability"
-        ],
-        "vocabulary": [
-            "environmental degradation",
-            "climate change",
-            "global warming",
-            "carbon footprint",
-            "renewable energy",
-            "sustainable development",
-            "biodiversity",
-            "deforestation",
-            "pollution control",
-            "eco-friendly"
-        ]
-    },
-    9: {
-        "name": "Transport",
-        "category": "City, Society, Environment",
-        "week": 2,
-        "key_areas": [
-            "Public vs private transport",
-            "Traffic problems",
-            "Transportation infrastructure",
-            "Future of transport"
-        ],
-        "vocabulary": [
-            "public transport",
-            "traffic congestion",
-            "carbon emissions",
-            "transportation infrastructure",
-            "commuting",
-            "rush hour",
-            "mass transit",
-            "environmentally friendly",
-            "traffic jam",
-            "road network"
-        ]
-    },
-    10: {
-        "name": "Travel",
-        "category": "City, Society, Environment",
-        "week": 2,
-        "key_areas": [
-            "Types of travel",
-            "Tourism benefits and drawbacks",
-            "Cultural exchange",
-            "Travel experiences"
-        ],
-        "vocabulary": [
-            "tourist destination",
-            "cultural exchange",
-            "travel industry",
-            "mass tourism",
-            "eco-tourism",
-            "travel experience",
-            "local customs",
-            "tourism revenue",
-            "tourist attraction",
-            "adventure tourism"
-        ]
-    },
-    11: {
-        "name": "Home / Accommodation",
-        "category": "City, Society, Environment",
-        "week": 2,
-        "key_areas": [
-            "Types of housing",
-            "Living conditions",
-            "Urban vs rural living",
-            "Housing issues"
-        ],
-        "vocabulary": [
-            "residential area",
-            "housing shortage",
-            "property market",
-            "living conditions",
-            "accommodation",
-            "rented accommodation",
-            "home ownership",
-            "urban dwelling",
-            "spacious",
-            "affordable housing"
-        ]
-    },
-    12: {
-        "name": "Shopping / Money",
-        "category": "City, Society, Environment",
-        "week": 2,
-        "key_areas": [
-            "Shopping habits",
-            "Consumer culture",
-            "Financial management",
-            "Online vs offline shopping"
-        ],
-        "vocabulary": [
-            "consumer goods",
-            "shopping habits",
-            "impulse buying",
-            "brand loyalty",
-            "online shopping",
-            "financial management",
-            "cost of living",
-            "disposable income",
-            "purchasing power",
-            "consumer society"
-        ]
-    },
-    13: {
-        "name": "Society",
-        "category": "City, Society, Environment",
-        "week": 2,
-        "key_areas": [
-            "Social issues",
-            "Community life",
-            "Social changes",
-            "Modern society"
-        ],
-        "vocabulary": [
-            "social cohesion",
-            "community spirit",
-            "social inequality",
-            "modern society",
-            "social norms",
-            "cultural diversity",
-            "generation gap",
-            "social interaction",
-            "social values",
-            "community involvement"
-        ]
-    },
-    14: {
-        "name": "Crime & Law",
-        "category": "City, Society, Environment",
-        "week": 2,
-        "key_areas": [
-            "Types of crime",
-            "Law enforcement",
-            "Justice system",
-            "Crime prevention"
-        ],
-        "vocabulary": [
-            "criminal activity",
-            "law enforcement",
-            "crime prevention",
-            "legal system",
-            "juvenile crime",
-            "crime rate",
-            "punishment",
-            "rehabilitation",
-            "public safety",
-            "law-abiding citizen"
-        ]
-    },
-
-    # WEEK 3 – Science, Culture, Media
-    15: {
-        "name": "Media & Advertising",
-        "category": "Science, Culture, Media",
-        "week": 3,
-        "key_areas": [
-            "Mass media",
-            "Advertising influence",
-            "News and information",
-            "Media impact on society"
-        ],
-        "vocabulary": [
-            "mass media",
-            "advertising campaign",
-            "consumer behavior",
-            "media coverage",
-            "fake news",
-            "freedom of press",
-            "media influence",
-            "target audience",
-            "marketing strategy",
-            "media literacy"
-        ]
-    },
-    16: {
-        "name": "Culture & Traditions",
-        "category": "Science, Culture, Media",
-        "week": 3,
-        "key_areas": [
-            "Cultural heritage",
-            "Traditions and customs",
-            "Cultural preservation",
-            "Cultural diversity"
-        ],
-        "vocabulary": [
-            "cultural heritage",
-            "traditional customs",
-            "cultural identity",
-            "cultural diversity",
-            "cultural preservation",
-            "indigenous culture",
-            "cultural exchange",
-            "ancestral traditions",
-            "cultural values",
-            "multicultural society"
-        ]
-    },
-    17: {
-        "name": "Science",
-        "category": "Science, Culture, Media",
-        "week": 3,
-        "key_areas": [
-            "Scientific research",
-            "Scientific discoveries",
-            "Science and society",
-            "Science education"
-        ],
-        "vocabulary": [
-            "scientific research",
-            "breakthrough",
-            "innovation",
-            "scientific method",
-            "research findings",
-            "technological advancement",
-            "scientific knowledge",
-            "empirical evidence",
-            "scientific community",
-            "research funding"
-        ]
-    },
-    18: {
-        "name": "Technology (Advanced)",
-        "category": "Science, Culture, Media",
-        "week": 3,
-        "key_areas": [
-            "Artificial Intelligence",
-            "Automation",
-            "Digital transformation",
-            "Future technology"
-        ],
-        "vocabulary": [
-            "artificial intelligence",
-            "automation",
-            "machine learning",
-            "digital transformation",
-            "technological disruption",
-            "data privacy",
-            "cybersecurity",
-            "virtual reality",
-            "smart devices",
-            "technological revolution"
-        ]
-    },
-    19: {
-        "name": "Global Issues",
-        "category": "Science, Culture, Media",
-        "week": 3,
-        "key_areas": [
-            "International problems",
-            "Global challenges",
-            "International cooperation",
-            "World affairs"
-        ],
-        "vocabulary": [
-            "global warming",
-            "poverty alleviation",
-            "humanitarian crisis",
-            "international cooperation",
-            "developing countries",
-            "global economy",
-            "world peace",
-            "natural disasters",
-            "refugee crisis",
-            "sustainable development"
-        ]
-    },
-    20: {
-        "name": "Economy",
-        "category": "Science, Culture, Media",
-        "week": 3,
-        "key_areas": [
-            "Economic systems",
-            "Economic development",
-            "Financial markets",
-            "Economic challenges"
-        ],
-        "vocabulary": [
-            "economic growth",
-            "economic development",
-            "financial stability",
-            "market economy",
-            "economic recession",
-            "inflation rate",
-            "unemployment",
-            "economic inequality",
-            "GDP",
-            "economic prosperity"
-        ]
-    },
-    21: {
-        "name": "Education (Advanced)",
-        "category": "Science, Culture, Media",
-        "week": 3,
-        "key_areas": [
-            "Higher education",
-            "Education reform",
-            "Online learning",
-            "Educational challenges"
-        ],
-        "vocabulary": [
-            "tertiary education",
-            "academic excellence",
-            "education reform",
-            "online learning",
-            "vocational training",
-            "educational resources",
-            "student debt",
-            "academic pressure",
-            "quality education",
-            "educational inequality"
-        ]
-    },
-
-    # WEEK 4 – Advanced Writing Topics
-    22: {
-        "name": "Government & Politics",
-        "category": "Advanced Writing Topics",
-        "week": 4,
-        "key_areas": [
-            "Political systems",
-            "Government policies",
-            "Democratic processes",
-            "Public administration"
-        ],
-        "vocabulary": [
-            "government policy",
-            "political system",
-            "democratic process",
-            "public administration",
-            "legislation",
-            "policy implementation",
-            "government spending",
-            "political stability",
-            "public sector",
-            "governance"
-        ]
-    },
-    23: {
-        "name": "Environment (Advanced)",
-        "category": "Advanced Writing Topics",
-        "week": 4,
-        "key_areas": [
-            "Environmental policies",
-            "Climate action",
-            "Green technology",
-            "Environmental activism"
-        ],
-        "vocabulary": [
-            "environmental policy",
-            "climate action",
-            "carbon neutrality",
-            "green technology",
-            "environmental protection",
-            "ecological balance",
-            "waste management",
-            "environmental awareness",
-            "sustainable practices",
-            "ecosystem"
-        ]
-    },
-    24: {
-        "name": "Health (Advanced)",
-        "category": "Advanced Writing Topics",
-        "week": 4,
-        "key_areas": [
-            "Public health",
-            "Healthcare policies",
-            "Medical research",
-            "Health challenges"
-        ],
-        "vocabulary": [
-            "public health",
-            "healthcare provision",
-            "medical breakthrough",
-            "preventive medicine",
-            "health epidemic",
-            "medical research",
-            "healthcare funding",
-            "health awareness",
-            "mental health issues",
-            "healthcare accessibility"
-        ]
-    },
-    25: {
-        "name": "Employment",
-        "category": "Advanced Writing Topics",
-        "week": 4,
-        "key_areas": [
-            "Job market trends",
-            "Employment policies",
-            "Future of work",
-            "Workplace issues"
-        ],
-        "vocabulary": [
-            "labor market",
-            "employment opportunities",
-            "job creation",
-            "workforce",
-            "remote working",
-            "gig economy",
-            "employment rights",
-            "workplace diversity",
-            "career development",
-            "job displacement"
-        ]
-    },
-    26: {
-        "name": "Art & Entertainment",
-        "category": "Advanced Writing Topics",
-        "week": 4,
-        "key_areas": [
-            "Art and culture",
-            "Entertainment industry",
-            "Cultural activities",
-            "Arts funding"
-        ],
-        "vocabulary": [
-            "artistic expression",
-            "cultural significance",
-            "entertainment industry",
-            "performing arts",
-            "visual arts",
-            "cultural venue",
-            "artistic talent",
-            "creative industry",
-            "arts funding",
-            "cultural event"
-        ]
-    },
-    27: {
-        "name": "Technology & Future",
-        "category": "Advanced Writing Topics",
-        "week": 4,
-        "key_areas": [
-            "Future predictions",
-            "Technological impact",
-            "Digital future",
-            "Innovation"
-        ],
-        "vocabulary": [
-            "future prospects",
-            "technological innovation",
-            "digital age",
-            "emerging technology",
-            "technological progress",
-            "future generations",
-            "scientific advancement",
-            "tech industry",
-            "digital economy",
-            "innovation hub"
-        ]
-    },
-    28: {
-        "name": "Social Media",
-        "category": "Advanced Writing Topics",
-        "week": 4,
-        "key_areas": [
-            "Social media influence",
-            "Online communication",
-            "Digital society",
-            "Social media challenges"
-        ],
-        "vocabulary": [
-            "social networking",
-            "online presence",
-            "digital communication",
-            "viral content",
-            "online community",
-            "social media platform",
-            "digital footprint",
-            "online harassment",
-            "information sharing",
-            "social media influencer"
-        ]
-    },
-    29: {
-        "name": "Education vs Work",
-        "category": "Advanced Writing Topics",
-        "week": 4,
-        "key_areas": [
-            "Academic vs practical skills",
-            "Work experience",
-            "Career preparation",
-            "Education value"
-        ],
-        "vocabulary": [
-            "academic qualifications",
-            "work experience",
-            "practical skills",
-            "career preparation",
-            "job-specific training",
-            "theoretical knowledge",
-            "professional skills",
-            "employability",
-            "skill development",
-            "workplace readiness"
-        ]
-    },
-    30: {
-        "name": "Review & Consolidation",
-        "category": "Final Review",
-        "week": 4,
-        "key_areas": [
-            "Review all topics",
-            "Practice using vocabulary",
-            "Consolidate learning",
-            "Prepare for exam"
-        ],
-        "vocabulary": [
-            "comprehensive review",
-            "vocabulary retention",
-            "topic mastery",
-            "exam preparation",
-            "practice exercises",
-            "skill consolidation",
-            "language proficiency",
-            "test strategies",
-            "performance improvement",
-            "confidence building"
-        ]
-    }
-}
-
-
-def get_current_day_number(start_date: date = None) -> int:
+from typing import Dict, List, Optional, Tuple
+
+import config
+from plan_packs import get_plan
+
+# Longest text Telegram accepts in one message
+MAX_MESSAGE_LENGTH = 4096
+
+# Without a start date plans cycle from this day, which keeps the cycle
+# continuous across years
+PLAN_EPOCH = date(2024, 1, 1)
+
+
+def get_current_day_number(today: date, start_date: date = None, plan: Optional[str] = None) -> int:
     """
     Get current day number in the 30-day plan
-    If start_date is None, use a default start date or cycle through days
+    today is the date in the chat's timezone (Database.get_today). If
+    start_date is None, use a default start date or cycle through days
+    """
+    return get_day_number(today, start_date, len(get_plan(plan)))
+
+
+def get_day_number(day: date, start_date: Optional[date] = None, plan_days: int = 30) -> int:
+    """Get the plan day number of a date, see get_current_day_number"""
+    return (day.toordinal() - (start_date or PLAN_EPOCH).toordinal()) % plan_days + 1
+
+
+def resolve_plan_day(enrollment: Optional[Tuple[str, int, Optional[int]]], day: date) -> Tuple[str, int]:
+    """Get the plan and day number a chat is on at day
+
+    enrollment is the chat's (plan, start, paused_at) from the database,
+    days as date ordinals, or None for the default plan and start date.
+    An enrolled chat goes through its plan once and then starts over; a
+    paused one stays on the day it was paused at.
     """
-    if start_date is None:
-        # Use day of year modulo 30 to cycle through topics
-        today = date.today()
-        day_of_year = today.timetuple().tm_yday
-        return (day_of_year % 30) + 1
-    else:
-        today = date.today()
-        days_passed = (today - start_date).days
-        current_day = (days_passed % 30) + 1
-        return current_day
-
-
-def get_topic_for_day(day_number: int) -> Dict:
+    if enrollment is None:
+        return config.TOPIC_PLAN, get_day_number(day, config.TOPICS_START_DATE, len(get_plan()))
+
+    plan, start, paused_at = enrollment
+    try:
+        plan_days = len(get_plan(plan))
+    except KeyError:
+        # The plan was removed from plans/
+        return resolve_plan_day(None, day)
+    elapsed = (paused_at if paused_at is not None else day.toordinal()) - start
+    return plan, max(0, elapsed) % plan_days + 1
+
+
+def get_topic_for_day(day_number: int, plan: Optional[str] = None) -> Dict:
     """Get topic information for a specific day"""
-    return TOPICS_PLAN.get(day_number, TOPICS_PLAN[1])
+    pack = get_plan(plan)
+    return pack.get_day(day_number) or pack.get_day(1)
 
 
-def get_current_topic(start_date: date = None) -> Dict:
-    """Get today's topic based on the 30-day plan"""
-    day_number = get_current_day_number(start_date)
-    return get_topic_for_day(day_number)
+def get_current_topic(today: date, start_date: date = None, plan: Optional[str] = None) -> Dict:
+    """Get the topic of today (a date in the chat's timezone) in the 30-day plan"""
+    day_number = get_current_day_number(today, start_date, plan)
+    return get_topic_for_day(day_number, plan)
 
 
-def format_topic_message(topic: Dict, day_number: int) -> str:
+def format_topic_message(topic: Dict, day_number: int, plan_days: int = 30) -> str:
     """Format topic information as a message"""
     message = f"""
-📚 **IELTS Vocabulary - Day {day_number}/30**
+📚 **IELTS Vocabulary - Day {day_number}/{plan_days}**
 
 🎯 **Topic: {topic['name']}**
 📂 Category: {topic['category']}
@@ -767,10 +95,89 @@ def format_topic_message(topic: Dict, day_number: int) -> str:
 💡 **Study Tips:**
 1. Learn the meaning and usage of each word
 2. Practice using words in sentences
-3. Review yesterday's vocabulary
+3. Review due words with /review
 4. Use words in speaking/writing practice
 
 Good luck with today's vocabulary! 🎯
 """
 
     return message
+
+
+def split_message(text: str, limit: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """Split text into messages of at most limit characters
+
+    Splits at blank lines where possible, then at line breaks, so Markdown
+    entities (which never span lines here) stay intact.
+    """
+    parts: List[str] = []
+    current = ''
+    for block in text.split('\n\n'):
+        candidate = f"{current}\n\n{block}" if current else block
+        if len(candidate) <= limit:
+            current = candidate
+            continue
+        if current:
+            parts.append(current)
+        current = ''
+        for line in block.split('\n'):
+            candidate = f"{current}\n{line}" if current else line
+            if len(candidate) <= limit:
+                current = candidate
+                continue
+            if current:
+                parts.append(current)
+            # A single line longer than a message is cut hard
+            while len(line) > limit:
+                parts.append(line[:limit])
+                line = line[limit:]
+            current = line
+    if current.strip():
+        parts.append(current)
+    return [part.strip('\n') for part in parts if part.strip()]
+
+
+class TopicCatalog:
+    """Ready-to-send topic messages for the days of a plan
+
+    A day is rendered on first use, or all at once by warm() at startup,
+    so serving a topic is a dictionary lookup.
+    """
+
+    def __init__(self, plan: Optional[str] = None):
+        self.plan = plan
+        self._messages: Dict[int, Tuple[str, ...]] = {}
+
+    def warm(self) -> int:
+        """Render every plan day; returns the number of messages"""
+        for day_number in range(1, len(get_plan(self.plan)) + 1):
+            self.get_messages(day_number)
+        return sum(map(len, self._messages.values()))
+
+    def get_messages(self, day_number: int) -> Tuple[str, ...]:
+        """Get the messages of a plan day, in sending order"""
+        messages = self._messages.get(day_number)
+        if messages is None:
+            pack = get_plan(self.plan)
+            if pack.get_day(day_number) is None:
+                return self.get_messages(1)
+            topic = pack.get_day(day_number)
+            messages = self._messages[day_number] = tuple(
+                split_message(format_topic_message(topic, day_number, len(pack)))
+            )
+        return messages
+
+
+_catalogs: Dict[str, TopicCatalog] = {}
+
+
+def get_catalog(plan: Optional[str] = None) -> TopicCatalog:
+    """Get the topic catalog of a plan (config.TOPIC_PLAN by default)"""
+    plan = plan or config.TOPIC_PLAN
+    catalog = _catalogs.get(plan)
+    if catalog is None:
+        catalog = _catalogs[plan] = TopicCatalog(plan)
+    return catalog
+
+
+topic_catalog = get_catalog()
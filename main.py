@@ -4,17 +4,24 @@ IELTS Study Buddy Bot - Main Entry Point
 """
 
 import logging
+import secrets
+from typing import Optional
 from telegram import Update
+from telegram.request import BaseRequest
 from telegram.ext import (
     Application,
     CommandHandler,
     CallbackQueryHandler,
+    InlineQueryHandler,
     MessageHandler,
     filters
 )
 import config
-from database import db
+from database import db, adb
 from scheduler import BotScheduler
+from update_processor import ChatOrderedUpdateProcessor
+from ielts_topics import topic_catalog
+from vocab_index import vocab_index
 from bot import (
     start_command,
     today_command,
@@ -22,7 +29,16 @@ from bot import (
     all_command,
     stats_command,
     help_command,
-    button_handler
+    schedule_command,
+    plan_command,
+    vocab_command,
+    review_command,
+    inline_query_handler,
+    timezone_command,
+    button_handler,
+    broadcaster,
+    edit_coalescer,
+    outbox
 )
 
 # Configure logging
@@ -32,6 +48,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Update types the handlers use; Telegram does not send the others
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY, Update.INLINE_QUERY]
+
 
 async def log_chat_id(update: Update, context):
     """Log chat ID to help users configure GROUP_CHAT_ID"""
@@ -40,6 +59,27 @@ async def log_chat_id(update: Update, context):
         logger.info(f"Message received from chat_id={chat.id}, type={chat.type}, title={chat.title or 'N/A'}")
 
 
+async def start_background_tasks(application: Application):
+    """Start the reminder scheduler and the outbox worker in the bot's event loop
+
+    The outbox first sends whatever was left queued by the last run.
+    """
+    application.bot_data['scheduler'].start()
+    outbox.start(application.bot)
+
+
+async def stop_background_tasks(application: Application):
+    """Stop the scheduler and the outbox worker; unsent messages stay queued
+
+    Runs after updates stop and before the bot shuts down, so debounced
+    dashboard edits are still sent, or queued if they fail.
+    """
+    application.bot_data['scheduler'].shutdown()
+    await edit_coalescer.flush()
+    await outbox.stop()
+    logger.info(f"Outbox stats: {await adb.get_outbox_stats()}")
+
+
 def main():
     """Main function to run the bot with scheduler"""
     if not config.BOT_TOKEN:
@@ -56,14 +96,67 @@ def main():
     if config.GROUP_CHAT_ID:
         logger.info(f"Group chat configured: {config.GROUP_CHAT_ID}")
     else:
-        logger.info("No group chat configured - reminders disabled")
-        logger.info("To enable group reminders:")
+        logger.info("No group chat configured - reminders go to chats that used the bot")
+        logger.info("To preconfigure a group:")
         logger.info("1. Add bot to your group")
         logger.info("2. Send /start in the group")
         logger.info("3. Check logs for 'chat_id=' and copy the ID to .env")
 
-    # Create application
-    application = Application.builder().token(config.BOT_TOKEN).build()
+    # Render the topics and index the vocabulary before the first request
+    logger.info(f"Topic catalog: {topic_catalog.warm()} messages")
+    vocab_index.build()
+
+    application = build_application()
+    scheduler = application.bot_data['scheduler']
+
+    # Start the bot
+    logger.info("Bot is running. Press Ctrl+C to stop.")
+
+    try:
+        if config.WEBHOOK_URL:
+            # Telegram pushes updates to our HTTPS endpoint; the secret token
+            # rejects requests that do not come from Telegram
+            logger.info(f"Serving webhook on {config.WEBHOOK_LISTEN}:{config.WEBHOOK_PORT}/{config.WEBHOOK_PATH}")
+            application.run_webhook(
+                listen=config.WEBHOOK_LISTEN,
+                port=config.WEBHOOK_PORT,
+                url_path=config.WEBHOOK_PATH,
+                webhook_url=f"{config.WEBHOOK_URL.rstrip('/')}/{config.WEBHOOK_PATH}",
+                secret_token=config.WEBHOOK_SECRET_TOKEN or secrets.token_urlsafe(32),
+                max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=ALLOWED_UPDATES
+            )
+        else:
+            application.run_polling(allowed_updates=ALLOWED_UPDATES)
+    except KeyboardInterrupt:
+        logger.info("Stopping bot...")
+    finally:
+        scheduler.shutdown()
+        logger.info(f"Dashboard edit stats: {edit_coalescer.get_stats()}")
+        logger.info(f"Broadcast stats: {broadcaster.get_stats()}")
+        adb.shutdown()
+        db.close()
+        logger.info("Bot stopped")
+
+
+def build_application(token: str = config.BOT_TOKEN, request: Optional[BaseRequest] = None) -> Application:
+    """Create the application with all handlers and the reminder scheduler
+
+    request replaces the HTTP client used for Bot API calls (the webhook
+    benchmark passes a fake one).
+    """
+    # The scheduler and outbox run inside the application's event loop.
+    # Updates from different chats are handled concurrently
+    builder = (
+        Application.builder()
+        .token(token)
+        .concurrent_updates(ChatOrderedUpdateProcessor())
+        .post_init(start_background_tasks)
+        .post_stop(stop_background_tasks)
+    )
+    if request is not None:
+        builder = builder.request(request)
+    application = builder.build()
 
     # Add command handlers
     application.add_handler(CommandHandler("start", start_command))
@@ -72,26 +165,22 @@ def main():
     application.add_handler(CommandHandler("all", all_command))
     application.add_handler(CommandHandler("stats", stats_command))
     application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("schedule", schedule_command))
+    application.add_handler(CommandHandler("timezone", timezone_command))
+    application.add_handler(CommandHandler("plan", plan_command))
+    application.add_handler(CommandHandler("vocab", vocab_command))
+    application.add_handler(CommandHandler("review", review_command))
     application.add_handler(CallbackQueryHandler(button_handler))
+    application.add_handler(InlineQueryHandler(inline_query_handler))
 
     # Add message handler to log chat IDs (helpful for setup)
     application.add_handler(MessageHandler(filters.ALL, log_chat_id), group=1)
 
-    # Setup and start scheduler
+    # Setup scheduler; it starts with the application
     scheduler = BotScheduler(application)
     scheduler.setup_jobs()
-    scheduler.start()
-
-    # Start the bot
-    logger.info("Bot is running. Press Ctrl+C to stop.")
 
-    try:
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
-    except KeyboardInterrupt:
-        logger.info("Stopping bot...")
-    finally:
-        scheduler.shutdown()
-        logger.info("Bot stopped")
+    return application
 
 
 if __name__ == '__main__':
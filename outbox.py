@@ -0,0 +1,234 @@
+"""
+Durable queue of outgoing messages
+Messages are written to the SQLite outbox before they are sent and a
+background worker drains it through the broadcaster. Failed sends are
+retried with jittered exponential backoff, and whatever is still pending
+when the process stops is sent after the next start
+"""
+
+import asyncio
+import json
+import logging
+import random
+import time
+from datetime import date
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from telegram import InlineKeyboardMarkup
+from telegram.error import BadRequest
+
+import config
+from broadcast import REJECTED, SENT, Broadcaster
+from database import adb, utc_today
+
+logger = logging.getLogger(__name__)
+
+# Called with what a message shows after a queued edit of it is delivered:
+# (chat_id, message_id, text, keyboard)
+EditSent = Callable[[int, int, str, Optional[InlineKeyboardMarkup]], None]
+
+
+class Outbox:
+    """Persistent outgoing message queue with a background sender"""
+
+    def __init__(self, broadcaster: Broadcaster,
+                 poll_interval: float = config.OUTBOX_POLL_SECONDS,
+                 batch_size: int = config.OUTBOX_BATCH_SIZE,
+                 max_attempts: int = config.OUTBOX_MAX_ATTEMPTS):
+        self.broadcaster = broadcaster
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self._bot = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        # Messages with a queued edit, so edits made directly can drop them
+        self._pending_edits: Set[Tuple[int, int]] = set()
+        self.on_edit_sent: Optional[EditSent] = None
+
+    async def send(self, chat_ids: Iterable[int], kind: str, text: str,
+                   parse_mode: Optional[str] = None, day: Optional[date] = None) -> int:
+        """Queue a message to each chat; a (chat, kind, day) is only ever sent once
+
+        Returns the number of messages queued.
+        """
+        return await self.send_many([(chat_id, text) for chat_id in chat_ids], kind, parse_mode, day)
+
+    async def send_many(self, messages: Iterable[Tuple[int, str]], kind: str,
+                        parse_mode: Optional[str] = None, day: Optional[date] = None) -> int:
+        """Queue personalized (chat_id, text) messages, see send"""
+        queued = await adb.enqueue_messages(list(messages), kind, day, parse_mode)
+        self.wake()
+        return queued
+
+    async def edit(self, chat_id: int, message_id: int, text: str,
+                   keyboard: Optional[InlineKeyboardMarkup]):
+        """Queue an edit of a message; only the latest queued edit is sent"""
+        reply_markup = keyboard.to_json() if keyboard is not None else None
+        await adb.enqueue_edit(chat_id, message_id, text, reply_markup, 'Markdown')
+        self._pending_edits.add((chat_id, message_id))
+        self.wake()
+
+    async def cancel_edit(self, chat_id: int, message_id: int):
+        """Drop the queued edit of a message that was just edited directly
+
+        Otherwise the queued, older render would overwrite the newer one.
+        """
+        key = (chat_id, message_id)
+        if key in self._pending_edits:
+            self._pending_edits.discard(key)
+            await adb.cancel_edit(chat_id, message_id)
+
+    def wake(self):
+        """Make the worker look for due messages now"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self, bot):
+        """Start the background worker; must be called from the event loop"""
+        self._bot = bot
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        self._task.add_done_callback(self._on_worker_done)
+
+    @staticmethod
+    def _on_worker_done(task: asyncio.Task):
+        """Log the worker stopping for any reason other than stop()"""
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            logger.error(f"Outbox worker stopped: {error!r}")
+        else:
+            logger.error("Outbox worker stopped unexpectedly")
+
+    async def stop(self):
+        """Stop the background worker; unsent messages stay queued"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def retry_delay(self, attempts: int) -> float:
+        """Backoff before the next attempt, with jitter so retries spread out"""
+        delay = min(config.OUTBOX_RETRY_MAX_SECONDS, config.OUTBOX_RETRY_BASE_SECONDS * 2 ** attempts)
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _prune(self):
+        expired, deleted = await adb.prune_outbox(config.OUTBOX_RETENTION_DAYS)
+        if expired or deleted:
+            logger.info(f"Outbox: expired {expired} stale messages, deleted {deleted} old ones")
+
+    async def _run(self):
+        """Drain due messages, then sleep until the next one is due or a wakeup
+
+        Errors are logged and the loop goes on after the poll interval, so a
+        locked database never stops the queue from draining.
+        """
+        pruned_day = None
+
+        while True:
+            timeout = self.poll_interval
+            try:
+                # Prune at startup and once a day after that; what is stale is
+                # decided by UTC dates, see prune_outbox
+                if utc_today() != pruned_day:
+                    await self._prune()
+                    pruned_day = utc_today()
+
+                processed = await self.drain()
+                if processed >= self.batch_size:
+                    continue
+
+                next_at = await adb.get_next_attempt_at()
+                if next_at is not None:
+                    timeout = min(timeout, max(0.1, next_at - time.time()))
+            except Exception as e:
+                logger.error(f"Error in outbox worker: {e}")
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def drain(self) -> int:
+        """Send one batch of due messages and record the results
+
+        Returns the number of messages attempted.
+        """
+        rows = await adb.get_due_messages(time.time(), self.batch_size)
+        if not rows:
+            return 0
+
+        calls = {}
+        for row in rows:
+            if row['message_id'] is not None:
+                # Also covers edits queued before a restart
+                self._pending_edits.add((row['chat_id'], row['message_id']))
+            calls[self._make_call(row)] = row
+
+        sent: List[int] = []
+        retry: List = []
+        failed: List = []
+
+        def on_result(call, outcome: str, error: Optional[str]):
+            row = calls[call]
+            if row['message_id'] is not None:
+                key = (row['chat_id'], row['message_id'])
+                if key not in self._pending_edits:
+                    # Cancelled while in flight, a newer render was sent
+                    return
+                if outcome == SENT or outcome == REJECTED or row['attempts'] + 1 >= self.max_attempts:
+                    self._pending_edits.discard(key)
+                if outcome == SENT and self.on_edit_sent is not None:
+                    self.on_edit_sent(row['chat_id'], row['message_id'], row['text'],
+                                      self._edit_keyboard(row))
+            if outcome == SENT:
+                sent.append(row['id'])
+            elif outcome == REJECTED or row['attempts'] + 1 >= self.max_attempts:
+                failed.append((row['id'], error))
+            else:
+                retry.append((row['id'], time.time() + self.retry_delay(row['attempts']), error))
+
+        await self.broadcaster.run(
+            ((row['chat_id'], call) for call, row in calls.items()), 'outbox', on_result
+        )
+        await adb.finish_messages(sent, retry, failed)
+        return len(rows)
+
+    def _make_call(self, row: Dict):
+        """Build the Bot API call for an outbox row"""
+        bot = self._bot
+
+        if row['message_id'] is None:
+            async def call():
+                await bot.send_message(chat_id=row['chat_id'], text=row['text'],
+                                       parse_mode=row['parse_mode'])
+            return call
+
+        keyboard = self._edit_keyboard(row)
+        key = (row['chat_id'], row['message_id'])
+
+        async def call():
+            if key not in self._pending_edits:
+                # Edited directly since this batch was fetched
+                return
+            try:
+                await bot.edit_message_text(chat_id=row['chat_id'], message_id=row['message_id'],
+                                            text=row['text'], reply_markup=keyboard,
+                                            parse_mode=row['parse_mode'])
+            except BadRequest as e:
+                # The message already shows this render
+                if 'not modified' not in str(e).lower():
+                    raise
+        return call
+
+    def _edit_keyboard(self, row: Dict) -> Optional[InlineKeyboardMarkup]:
+        """Get the keyboard of an outbox edit row"""
+        if not row['reply_markup']:
+            return None
+        return InlineKeyboardMarkup.de_json(json.loads(row['reply_markup']), self._bot)
@@ -0,0 +1,234 @@
+"""
+Topic plan packs
+A plan is a JSON Lines file in plans/ with one day per line. It is
+compiled to a .pack file next to it: an offset table followed by each
+day's compact JSON, so a day is read from the memory-mapped pack and
+decoded only when it is first used, and plans nobody uses are never
+opened
+
+    python plan_packs.py            compile every plan
+    python plan_packs.py benchmark  compare with a Python dict literal
+"""
+
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+from typing import Dict, List, Optional, Union
+
+import config
+
+logger = logging.getLogger(__name__)
+
+PACK_MAGIC = b'TPK1'
+# Magic, then the number of days
+PACK_HEADER = struct.Struct('<4sI')
+# Day offsets are relative to the end of the offset table; a day spans
+# from its offset to the next one
+OFFSET = struct.Struct('<I')
+OFFSET_PAIR = struct.Struct('<2I')
+
+SOURCE_SUFFIX = '.jsonl'
+PACK_SUFFIX = '.pack'
+
+# Plan names are file names in plans/, never paths
+PLAN_NAME_RE = re.compile(r'[\w-]+')
+
+
+class PlanPackError(ValueError):
+    """Raised for plan sources or packs that are malformed"""
+
+
+def compile_pack(source: str) -> bytes:
+    """Compile a JSON Lines plan into pack bytes
+
+    Each line is a day object whose 'day' field numbers it, starting at 1.
+    """
+    days: List[bytes] = []
+    with open(source, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                day = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise PlanPackError(f"{source}:{line_number}: {e}") from e
+            if day.get('day') != len(days) + 1:
+                raise PlanPackError(f"{source}:{line_number}: expected day {len(days) + 1}")
+            days.append(json.dumps(day, ensure_ascii=False, separators=(',', ':')).encode())
+    if not days:
+        raise PlanPackError(f"{source}: no days")
+
+    offsets = [0]
+    for data in days:
+        offsets.append(offsets[-1] + len(data))
+    return b''.join([
+        PACK_HEADER.pack(PACK_MAGIC, len(days)),
+        b''.join(OFFSET.pack(offset) for offset in offsets),
+        *days,
+    ])
+
+
+class PlanPack:
+    """Read-only view of a compiled plan with lazy per-day decoding"""
+
+    def __init__(self, name: str, data: Union[bytes, mmap.mmap]):
+        magic, count = PACK_HEADER.unpack_from(data)
+        if magic != PACK_MAGIC:
+            raise PlanPackError(f"{name}: not a plan pack")
+        self.name = name
+        self._data = data
+        self._count = count
+        self._base = PACK_HEADER.size + OFFSET.size * (count + 1)
+        self._days: Dict[int, Dict] = {}
+
+    def __len__(self) -> int:
+        return self._count
+
+    def get_day(self, day_number: int) -> Optional[Dict]:
+        """Get a day of the plan, or None outside 1..len(plan)"""
+        day = self._days.get(day_number)
+        if day is None:
+            if not 1 <= day_number <= self._count:
+                return None
+            start, end = OFFSET_PAIR.unpack_from(self._data, PACK_HEADER.size + OFFSET.size * (day_number - 1))
+            day = self._days[day_number] = json.loads(self._data[self._base + start:self._base + end])
+        return day
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+
+
+def _open_pack(name: str, plans_dir: str) -> PlanPack:
+    """Open a plan's pack, compiling it first if it is missing or stale"""
+    if not PLAN_NAME_RE.fullmatch(name) or name not in available_plans(plans_dir):
+        raise KeyError(f"Unknown plan: {name}")
+    source = os.path.join(plans_dir, name + SOURCE_SUFFIX)
+    target = os.path.join(plans_dir, name + PACK_SUFFIX)
+
+    if os.path.exists(source) and (
+        not os.path.exists(target) or os.path.getmtime(target) < os.path.getmtime(source)
+    ):
+        data = compile_pack(source)
+        try:
+            with open(target + '.tmp', 'wb') as f:
+                f.write(data)
+            os.replace(target + '.tmp', target)
+        except OSError as e:
+            # Read-only install: serve the compiled bytes from memory
+            logger.warning(f"Could not write plan pack {target}: {e}")
+            return PlanPack(name, data)
+        logger.info(f"Compiled plan pack {target}")
+
+    with open(target, 'rb') as f:
+        return PlanPack(name, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+_packs: Dict[str, PlanPack] = {}
+
+
+def get_plan(name: Optional[str] = None) -> PlanPack:
+    """Get a plan pack by name (config.TOPIC_PLAN by default), opening it on first use"""
+    name = name or config.TOPIC_PLAN
+    pack = _packs.get(name)
+    if pack is None:
+        pack = _packs[name] = _open_pack(name, config.PLANS_DIR)
+    return pack
+
+
+def available_plans(plans_dir: Optional[str] = None) -> List[str]:
+    """Get the names of all plans in the plans directory"""
+    names = set()
+    for filename in os.listdir(plans_dir or config.PLANS_DIR):
+        base, suffix = os.path.splitext(filename)
+        if suffix in (SOURCE_SUFFIX, PACK_SUFFIX) and PLAN_NAME_RE.fullmatch(base):
+            names.add(base)
+    return sorted(names)
+
+
+def compile_all() -> List[str]:
+    """Compile every plan source whose pack is missing or stale"""
+    names = [name for name in available_plans()
+             if os.path.exists(os.path.join(config.PLANS_DIR, name + SOURCE_SUFFIX))]
+    for name in names:
+        _open_pack(name, config.PLANS_DIR).close()
+    return names
+
+
+def benchmark(name: Optional[str] = None, runs: int = 5) -> Dict:
+    """Compare loading a plan pack with importing the plan as a dict literal
+
+    Each variant runs in fresh interpreters that have already imported
+    config and the standard modules the bot loads anyway, after one run
+    that writes the .pyc. Reports the best time to get day 1, the resident
+    set size afterwards (which includes the pack's mapped pages that were
+    read) and the Python heap kept, all net of an interpreter that does
+    nothing.
+    """
+    import subprocess
+    import sys
+    import tempfile
+
+    pack = get_plan(name)
+    plan = {day_number: pack.get_day(day_number) for day_number in range(1, len(pack) + 1)}
+    workdir = tempfile.mkdtemp()
+    with open(os.path.join(workdir, 'dict_plan.py'), 'w', encoding='utf-8') as f:
+        f.write(f"TOPICS_PLAN = {plan!r}\n")
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    variants = {
+        'baseline': "pass",
+        'dict': "import dict_plan; topic = dict_plan.TOPICS_PLAN[1]",
+        'pack': "import plan_packs; topic = plan_packs.get_plan(%r).get_day(1)" % pack.name,
+    }
+    script = (
+        "import os, resource, sys, time, tracemalloc\n"
+        "import config, json, logging, mmap, struct\n"
+        "mode = sys.argv[1]\n"
+        "if mode == 'heap': tracemalloc.start()\n"
+        "started = time.perf_counter()\n"
+        "{code}\n"
+        "seconds = time.perf_counter() - started\n"
+        "if mode == 'heap': print(tracemalloc.get_traced_memory()[0])\n"
+        "elif mode == 'rss':\n"
+        "    try:\n"
+        "        with open('/proc/self/statm') as f:\n"
+        "            print(int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE'))\n"
+        "    except OSError:\n"
+        "        # Peak rather than current RSS, in KiB on Linux and bytes on macOS\n"
+        "        scale = 1 if sys.platform == 'darwin' else 1024\n"
+        "        print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale)\n"
+        "else: print(seconds)\n"
+    )
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([workdir, here]))
+
+    def measure(code: str, mode: str) -> float:
+        return float(subprocess.run([sys.executable, '-c', script.format(code=code), mode], env=env,
+                                    capture_output=True, text=True, check=True).stdout)
+
+    results = {}
+    for variant, code in variants.items():
+        seconds = [measure(code, 'time') for _ in range(runs + 1)][1:]
+        rss = [measure(code, 'rss') for _ in range(runs)]
+        results[variant] = (min(seconds), min(rss), measure(code, 'heap'))
+
+    base_seconds, base_rss, base_heap = results.pop('baseline')
+    return {
+        variant: {'load_ms': round((seconds - base_seconds) * 1000, 2),
+                  'rss_kb': round((rss - base_rss) / 1024, 1),
+                  'heap_kb': round((heap - base_heap) / 1024, 1)}
+        for variant, (seconds, rss, heap) in results.items()
+    }
+
+
+if __name__ == '__main__':
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    if sys.argv[1:2] == ['benchmark']:
+        print(benchmark(sys.argv[2] if len(sys.argv) > 2 else None))
+    else:
+        print(f"Compiled plans: {', '.join(compile_all())}")
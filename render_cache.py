@@ -0,0 +1,45 @@
+"""
+Memoization of rendered messages and keyboards
+Entries are keyed by the day and the state versions of the users they
+show, so a change to one user only rebuilds the parts that show that user
+"""
+
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, TypeVar
+
+import config
+
+T = TypeVar('T')
+
+
+class RenderCache:
+    """Bounded LRU cache of render results"""
+
+    def __init__(self, max_entries: int = config.RENDER_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: Hashable, build: Callable[[], T]) -> T:
+        """Get the cached value for key, building and storing it on a miss"""
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self._misses += 1
+            value = self._entries[key] = build()
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return value
+
+        self._hits += 1
+        self._entries.move_to_end(key)
+        return value
+
+    def clear(self):
+        """Drop all cached renders"""
+        self._entries.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get hit and miss counters and the number of cached entries"""
+        return {'hits': self._hits, 'misses': self._misses, 'entries': len(self._entries)}
@@ -0,0 +1,68 @@
+"""
+Spaced repetition of plan vocabulary (SM-2)
+Every phrase a user has reached in their plan becomes a review card. A
+recall grade moves the card's due date by an interval that grows with
+each successful review and with the card's ease
+"""
+
+from enum import IntEnum
+from typing import Dict, Iterable, List, Tuple
+
+from plan_packs import get_plan
+
+# Ease factor of new cards and the lowest it can fall to
+INITIAL_EASE = 2.5
+MIN_EASE = 1.3
+
+
+class Grade(IntEnum):
+    """Recall grades, with their SM-2 quality scores (0-5)"""
+    AGAIN = 1
+    HARD = 3
+    GOOD = 4
+    EASY = 5
+
+
+# Button labels, in keyboard order
+GRADE_LABELS = {
+    Grade.AGAIN: "🔁 Не помню",
+    Grade.HARD: "😓 Трудно",
+    Grade.GOOD: "🙂 Помню",
+    Grade.EASY: "😎 Легко",
+}
+
+
+def schedule_review(card: Dict, grade: Grade) -> Tuple[float, int, int]:
+    """Apply a grade to a card with ease, interval_days and repetitions
+
+    Returns the new (ease, interval in days, repetitions). A failed recall
+    starts the card over with a one-day interval.
+    """
+    quality = int(grade)
+    ease = max(MIN_EASE, card['ease'] + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+
+    if quality < 3:
+        return ease, 1, 0
+
+    repetitions = card['repetitions'] + 1
+    if repetitions == 1:
+        interval = 1
+    elif repetitions == 2:
+        interval = 6
+    else:
+        interval = round(card['interval_days'] * card['ease'])
+    return ease, interval, repetitions
+
+
+def plan_cards(user_id: int, plan: str, day_numbers: Iterable[int]) -> List[Tuple[int, str, int, int, str]]:
+    """Get the (user_id, plan, plan_day, item, phrase) cards of plan days' vocabulary"""
+    pack = get_plan(plan)
+    cards = []
+    for day_number in day_numbers:
+        topic = pack.get_day(day_number)
+        if topic is not None:
+            cards.extend(
+                (user_id, plan, day_number, item, phrase)
+                for item, phrase in enumerate(topic['vocabulary'])
+            )
+    return cards
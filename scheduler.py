@@ -1,73 +1,164 @@
+import asyncio
+import heapq
 import logging
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+import pytz
 from telegram.ext import Application
 import config
-from bot import send_morning_reminder, send_afternoon_reminder, send_daily_topic
+from database import REMINDER_KINDS, adb, db, local_today
+from bot import send_morning_reminder, send_afternoon_reminder, send_daily_topic, send_nudges, run_review_batch
 
 logger = logging.getLogger(__name__)
 
+# Sender of each reminder kind; 'nudge' goes to users instead of chats,
+# and 'review' is the nightly spaced repetition batch over all users
+REMINDERS = {
+    'morning': send_morning_reminder,
+    'afternoon': send_afternoon_reminder,
+    'topic': send_daily_topic,
+    'nudge': send_nudges,
+    'review': run_review_batch,
+}
+
+# Recipients sharing a reminder kind, timezone name and local time 'HH:MM'
+Bucket = Tuple[str, str, str]
+
+# Longest sleep between checks, so clock jumps are noticed
+MAX_SLEEP_SECONDS = 60
+
+
+def next_fire_at(timezone: str, reminder_time: str, now: Optional[float] = None) -> float:
+    """Get the next instant (Unix time) at which it is reminder_time in timezone"""
+    tz = pytz.timezone(timezone)
+    at = config.parse_time(reminder_time)
+    now = time.time() if now is None else now
+    day = datetime.fromtimestamp(now, tz).date()
+
+    while True:
+        # normalize() moves times skipped by a DST change forward
+        fire = tz.normalize(tz.localize(datetime.combine(day, at)))
+        if fire.timestamp() > now:
+            return fire.timestamp()
+        day += timedelta(days=1)
+
 
 class BotScheduler:
+    """Fires reminders from a min-heap of instants
+
+    Recipients are grouped into buckets by (kind, timezone, local time),
+    and buckets whose next occurrence is the same instant share one heap
+    entry. A single task sleeps until the earliest instant, so the work
+    per wakeup does not depend on how many chats and users are scheduled.
+    """
+
     def __init__(self, application: Application):
         self.application = application
-        self.scheduler = AsyncIOScheduler(timezone=config.TIMEZONE)
+        self._heap: List[float] = []
+        self._due: Dict[float, List[Bucket]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._firing: Set[asyncio.Task] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        application.bot_data['scheduler'] = self
 
     def setup_jobs(self):
         """Setup scheduled jobs"""
-        # Morning reminder
-        morning_hour, morning_minute = config.MORNING_REMINDER.hour, config.MORNING_REMINDER.minute
-        self.scheduler.add_job(
-            self._morning_job,
-            CronTrigger(hour=morning_hour, minute=morning_minute, timezone=config.TIMEZONE),
-            id='morning_reminder',
-            name='Morning Reminder'
-        )
-        logger.info(f"Scheduled morning reminder at {morning_hour:02d}:{morning_minute:02d}")
-
-        # Afternoon reminder
-        afternoon_hour, afternoon_minute = config.AFTERNOON_REMINDER.hour, config.AFTERNOON_REMINDER.minute
-        self.scheduler.add_job(
-            self._afternoon_job,
-            CronTrigger(hour=afternoon_hour, minute=afternoon_minute, timezone=config.TIMEZONE),
-            id='afternoon_reminder',
-            name='Afternoon Reminder'
-        )
-        logger.info(f"Scheduled afternoon reminder at {afternoon_hour:02d}:{afternoon_minute:02d}")
-
-        # Daily topic reminder
-        topic_hour, topic_minute = config.TOPIC_REMINDER.hour, config.TOPIC_REMINDER.minute
-        self.scheduler.add_job(
-            self._topic_job,
-            CronTrigger(hour=topic_hour, minute=topic_minute, timezone=config.TIMEZONE),
-            id='daily_topic',
-            name='Daily IELTS Topic'
-        )
-        logger.info(f"Scheduled daily topic at {topic_hour:02d}:{topic_minute:02d}")
-
-    async def _morning_job(self):
-        """Morning reminder job"""
-        await send_morning_reminder(self.application)
-
-    async def _afternoon_job(self):
-        """Afternoon reminder job"""
-        await send_afternoon_reminder(self.application)
-
-    async def _topic_job(self):
-        """Daily topic job"""
-        await send_daily_topic(self.application)
+        self.refresh_jobs()
+
+    def get_buckets(self) -> List[Bucket]:
+        """Get every (kind, timezone, time) bucket used by a chat or user"""
+        buckets = []
+        for kind in REMINDER_KINDS:
+            # In nudge mode afternoon buckets still fire, for groups with
+            # participants who cannot be nudged privately
+            buckets.extend((kind, timezone, at) for timezone, at in db.get_reminder_schedule(kind))
+        if config.AFTERNOON_REMINDER_MODE == 'nudge':
+            buckets.extend(('nudge', timezone, at) for timezone, at in db.get_nudge_schedule())
+        buckets.append(('review', config.TIMEZONE.zone, config.REVIEW_BATCH_TIME))
+        return buckets
+
+    def refresh_jobs(self, buckets: Optional[List[Bucket]] = None):
+        """Rebuild the heap from the current chat and user settings
+
+        Called again whenever a schedule or timezone changes. Buckets look
+        up their recipients when they fire, so new chats need no refresh.
+        """
+        if buckets is None:
+            buckets = self.get_buckets()
+        self._heap = []
+        self._due = {}
+        now = time.time()
+        for bucket in buckets:
+            self._push(bucket, now)
+        logger.info(f"Scheduled {len(self._due)} reminder instants for {sum(map(len, self._due.values()))} buckets")
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def refresh(self):
+        """refresh_jobs from async code, reading the settings on the DB thread"""
+        self.refresh_jobs(await adb.run(self.get_buckets))
+
+    def _push(self, bucket: Bucket, now: float):
+        _, timezone, at = bucket
+        fire_at = next_fire_at(timezone, at, now)
+        if fire_at not in self._due:
+            self._due[fire_at] = []
+            heapq.heappush(self._heap, fire_at)
+        self._due[fire_at].append(bucket)
+
+    async def _run(self):
+        """Sleep until the earliest instant, fire its buckets, reschedule them"""
+        while True:
+            self._wakeup.clear()
+            timeout = MAX_SLEEP_SECONDS
+            if self._heap:
+                timeout = min(timeout, self._heap[0] - time.time())
+
+            if timeout > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            fire_at = heapq.heappop(self._heap)
+            buckets = self._due.pop(fire_at)
+            for bucket in buckets:
+                task = asyncio.create_task(self._fire(bucket))
+                self._firing.add(task)
+                task.add_done_callback(self._firing.discard)
+                self._push(bucket, fire_at)
+
+    async def _fire(self, bucket: Bucket):
+        """Send a bucket's reminder to the recipients it has now"""
+        kind, timezone, at = bucket
+        try:
+            if kind == 'review':
+                # The batch finds its users itself
+                await REMINDERS[kind](self.application, None, local_today(pytz.timezone(timezone)))
+                return
+            if kind == 'nudge':
+                schedule = await adb.get_nudge_schedule()
+            else:
+                schedule = await adb.get_reminder_schedule(kind)
+            recipients = schedule.get((timezone, at), [])
+            if recipients:
+                day = local_today(pytz.timezone(timezone))
+                await REMINDERS[kind](self.application, recipients, day)
+        except Exception as e:
+            logger.error(f"Error sending {kind} reminder for {timezone} {at}: {e}")
 
     def start(self):
-        """Start the scheduler"""
-        self.scheduler.start()
+        """Start the scheduler; must be called from the event loop"""
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
         logger.info("Scheduler started")
 
     def shutdown(self):
         """Shutdown the scheduler"""
-        try:
-            if self.scheduler.running:
-                self.scheduler.shutdown(wait=False)
-                logger.info("Scheduler stopped")
-        except RuntimeError as e:
-            # Event loop might be closed already, which is fine during shutdown
-            logger.debug(f"Scheduler shutdown: {e}")
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            logger.info("Scheduler stopped")
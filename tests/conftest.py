@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# config is read at import time, so point it at a throwaway database first
+os.environ.setdefault('DB_PATH', os.path.join(tempfile.mkdtemp(), 'test.db'))
+os.environ.setdefault('GROUP_CHAT_ID', '0')
+os.environ.setdefault('STUDY_BUDDIES', '')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
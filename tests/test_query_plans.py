@@ -0,0 +1,63 @@
+"""
+The stats and day status queries must read daily_rollup through its
+primary key or idx_daily_rollup_date, never by scanning the table
+"""
+
+from datetime import date
+
+import pytest
+
+from database import Database
+
+DAY = date(2024, 3, 1)
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / 'plans.db'))
+    for user_id in (1, 2, 3):
+        database.add_user(user_id, f'User {user_id}')
+    conn = database.get_connection()
+    with conn:
+        conn.executemany(
+            'INSERT INTO daily_rollup (user_id, date, completed_count, mask) VALUES (?, ?, 1, 1)',
+            [(user_id, date(2024, 1, 1 + day)) for user_id in (1, 2, 3) for day in range(30)]
+        )
+        conn.execute('ANALYZE')
+    yield database
+    database.close()
+
+
+def rollup_plans(db, call):
+    """Run call and get the query plan of each daily_rollup query it makes"""
+    conn = db.get_connection()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        call()
+    finally:
+        conn.set_trace_callback(None)
+
+    plans = [
+        [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql)]
+        for sql in statements if 'daily_rollup' in sql and sql.lstrip().upper().startswith('SELECT')
+    ]
+    assert plans, 'no daily_rollup query was made'
+    return plans
+
+
+@pytest.mark.parametrize('call', [
+    pytest.param(lambda db: db.get_period_stats(1), id='period_stats_all_time'),
+    pytest.param(lambda db: db.get_period_stats(1, days=7), id='period_stats_week'),
+    pytest.param(lambda db: db.get_today_status_many([1, 2, 3], DAY), id='day_status_many'),
+    pytest.param(lambda db: db.is_day_complete(1, DAY), id='day_complete'),
+    pytest.param(lambda db: db.get_open_task_masks([1, 2, 3], DAY), id='open_task_masks'),
+])
+def test_rollup_queries_use_an_index(db, call):
+    for plan in rollup_plans(db, lambda: call(db)):
+        # get_open_task_masks aliases the table as r
+        rollup_steps = [step for step in plan if step.split()[1] in ('daily_rollup', 'r')]
+        assert rollup_steps, plan
+        for step in rollup_steps:
+            assert step.startswith('SEARCH'), plan
+            assert 'PRIMARY KEY' in step or 'idx_daily_rollup_date' in step, plan
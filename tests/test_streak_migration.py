@@ -0,0 +1,67 @@
+"""
+Databases from before the saved streak columns keep their streaks when a
+completed day is un-ticked after the migration
+"""
+
+import sqlite3
+from datetime import date
+
+from database import Database
+
+DAY = date(2024, 3, 1)
+
+
+def create_baseline(path: str, task_names):
+    """Write a database with the original users, completions and streaks tables"""
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executescript('''
+            CREATE TABLE users (
+                user_id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE TABLE completions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                date DATE NOT NULL,
+                task_name TEXT NOT NULL,
+                completed BOOLEAN DEFAULT 0,
+                completed_at TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(user_id),
+                UNIQUE(user_id, date, task_name)
+            );
+            CREATE TABLE streaks (
+                user_id INTEGER PRIMARY KEY,
+                current_streak INTEGER DEFAULT 0,
+                best_streak INTEGER DEFAULT 0,
+                last_completion_date DATE,
+                FOREIGN KEY (user_id) REFERENCES users(user_id)
+            );
+        ''')
+        conn.execute("INSERT INTO users (user_id, name) VALUES (1, 'Alice')")
+        conn.executemany(
+            'INSERT INTO completions (user_id, date, task_name, completed) VALUES (1, ?, ?, 1)',
+            [(DAY.isoformat(), task_name) for task_name in task_names]
+        )
+        conn.execute('INSERT INTO streaks VALUES (1, 1, 1, ?)', (DAY.isoformat(),))
+    conn.close()
+
+
+def test_untick_after_migration_keeps_streak(tmp_path):
+    path = str(tmp_path / 'baseline.db')
+    tasks = Database(str(tmp_path / 'tasks.db')).get_daily_tasks()
+    create_baseline(path, tasks)
+
+    db = Database(path)
+    try:
+        assert db.is_day_complete(1, DAY)
+        db.toggle_task(1, tasks[0], DAY)
+        assert not db.is_day_complete(1, DAY)
+        assert db.get_streak(1) == (1, 1)
+
+        # Ticking it again completes the same day, without counting it twice
+        db.toggle_task(1, tasks[0], DAY)
+        assert db.get_streak(1) == (1, 1)
+    finally:
+        db.close()
@@ -0,0 +1,105 @@
+"""
+Concurrent update processing with per-chat ordering
+Updates from different chats are handled in parallel, up to a limit,
+while updates from the same chat run one at a time in arrival order, so
+handlers that read and then write a chat's state (like a checklist
+toggle) never interleave
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def update_key(update: object) -> Optional[int]:
+    """Get the ID updates are serialized by: the chat, else the user"""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        # Inline queries and buttons on inline messages have no chat
+        return update.effective_user.id
+    return None
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Runs updates concurrently, one at a time per chat
+
+    An update first takes its chat's lock and then one of max_in_flight
+    slots, so updates queued behind a busy chat do not hold slots other
+    chats could use. Up to max_queued updates are accepted at once.
+    """
+
+    def __init__(self, max_in_flight: int = config.UPDATE_CONCURRENCY,
+                 max_queued: int = config.UPDATE_MAX_QUEUED):
+        super().__init__(max(max_queued, max_in_flight, 2))
+        self.max_in_flight = max_in_flight
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._waiters: Dict[int, int] = {}
+        self._in_flight = 0
+        self._stats = {'processed': 0, 'max_queued': 0, 'max_in_flight': 0,
+                       'wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+
+    @property
+    def queued(self) -> int:
+        """Updates accepted but not yet running"""
+        return sum(self._waiters.values()) - self._in_flight
+
+    def get_stats(self) -> Dict:
+        """Get the current queue depth and in-flight count, and totals"""
+        processed = self._stats['processed']
+        return {
+            'queued': self.queued,
+            'in_flight': self._in_flight,
+            'processed': processed,
+            'max_queued': self._stats['max_queued'],
+            'max_in_flight': self._stats['max_in_flight'],
+            'avg_wait_ms': round(self._stats['wait_seconds'] / processed * 1000, 1) if processed else 0.0,
+            'max_wait_ms': round(self._stats['max_wait_seconds'] * 1000, 1),
+        }
+
+    async def do_process_update(self, update: object, coroutine):
+        key = update_key(update)
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        self._stats['max_queued'] = max(self._stats['max_queued'], self.queued)
+        arrived = time.monotonic()
+
+        try:
+            # Updates without a chat or user (key None) share one lock
+            async with lock, self._slots:
+                waited = time.monotonic() - arrived
+                self._stats['wait_seconds'] += waited
+                self._stats['max_wait_seconds'] = max(self._stats['max_wait_seconds'], waited)
+                self._in_flight += 1
+                self._stats['max_in_flight'] = max(self._stats['max_in_flight'], self._in_flight)
+                try:
+                    await coroutine
+                finally:
+                    self._in_flight -= 1
+                    self._stats['processed'] += 1
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                # Nobody else is waiting on this chat, forget its lock
+                del self._waiters[key]
+                del self._locks[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        if self._stats['processed']:
+            logger.info(f"Update processing stats: {self.get_stats()}")
@@ -0,0 +1,258 @@
+"""
+Vocabulary search over every day of every topic plan
+Phrases from the vocabulary, key areas and topic names are split into
+words. An inverted index maps each word to the phrases containing it, a
+sorted word list answers prefix queries by binary search, and a trigram
+index finds words within a small edit distance for typo tolerance
+
+Benchmark:
+    python vocab_index.py [copies] [queries]
+"""
+
+import bisect
+import heapq
+import logging
+import re
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from plan_packs import available_plans, get_plan
+
+logger = logging.getLogger(__name__)
+
+# Topic fields that are searched, in ranking order
+SEARCH_FIELDS = ('vocabulary', 'key_areas', 'name')
+
+# Match weights of a query word against an indexed word
+EXACT, PREFIX, FUZZY = 3, 2, 1
+
+# Shortest query word tried as a prefix or with typos
+MIN_PREFIX_LENGTH = 2
+MIN_FUZZY_LENGTH = 4
+
+_WORD_RE = re.compile(r"[^\W_]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase words"""
+    return _WORD_RE.findall(text.lower())
+
+
+def trigrams(word: str) -> Set[str]:
+    """Get the trigrams of a word padded at both ends"""
+    padded = f"${word}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_typos(word: str) -> int:
+    """Edits allowed between a query word and a match"""
+    return 1 if len(word) < 8 else 2
+
+
+def within_distance(a: str, b: str, limit: int) -> bool:
+    """Whether a and b are at most limit edits apart
+
+    Edits are insertions, deletions, substitutions and swaps of adjacent
+    letters (optimal string alignment distance).
+    """
+    if abs(len(a) - len(b)) > limit:
+        return False
+    # Only cells within limit of the diagonal can stay within limit
+    beyond = limit + 1
+    before, previous = None, [j if j <= limit else beyond for j in range(len(b) + 1)]
+    for i, char_a in enumerate(a, 1):
+        current = [i if i <= limit else beyond] + [beyond] * len(b)
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            char_b = b[j - 1]
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b))
+            if i > 1 and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b:
+                cost = min(cost, before[j - 2] + 1)
+            current[j] = cost
+        if min(current) > limit:
+            return False
+        before, previous = previous, current
+    return previous[-1] <= limit
+
+
+class VocabIndex:
+    """Inverted, prefix and trigram index over plan phrases
+
+    Built once (build() at startup, or on the first search); queries only
+    touch the words that can match.
+    """
+
+    def __init__(self):
+        # Phrase entries: (phrase, field, plan, day number, topic name)
+        self._entries: List[Tuple[str, str, str, int, str]] = []
+        # Each phrase's words joined by spaces, to spot exact phrase matches
+        self._normalized: List[str] = []
+        self._postings: Dict[str, List[int]] = {}
+        self._words: List[str] = []
+        self._trigrams: Dict[str, List[int]] = {}
+        self._built = False
+        self.build_seconds = 0.0
+
+    def build(self, plans: Optional[Iterable[str]] = None, copies: int = 1) -> int:
+        """Index every day of the plans (all of them by default)
+
+        copies repeats the plans, to benchmark larger catalogs. Returns the
+        number of indexed phrases.
+        """
+        started = time.perf_counter()
+        entries = []
+        for _ in range(copies):
+            for plan in plans if plans is not None else available_plans():
+                pack = get_plan(plan)
+                for day_number in range(1, len(pack) + 1):
+                    topic = pack.get_day(day_number)
+                    for field in SEARCH_FIELDS:
+                        phrases = topic.get(field, [])
+                        for phrase in [phrases] if isinstance(phrases, str) else phrases:
+                            entries.append((phrase, field, plan, day_number, topic['name']))
+
+        postings: Dict[str, List[int]] = {}
+        normalized = []
+        for entry_id, entry in enumerate(entries):
+            words = tokenize(entry[0])
+            normalized.append(' '.join(words))
+            for word in set(words):
+                postings.setdefault(word, []).append(entry_id)
+
+        words = sorted(postings)
+        grams: Dict[str, List[int]] = {}
+        for word_id, word in enumerate(words):
+            for gram in trigrams(word):
+                grams.setdefault(gram, []).append(word_id)
+
+        self._entries, self._normalized = entries, normalized
+        self._postings, self._words, self._trigrams = postings, words, grams
+        self._built = True
+        self.build_seconds = time.perf_counter() - started
+        logger.info(f"Vocabulary index: {len(entries)} phrases, {len(words)} words "
+                    f"in {self.build_seconds * 1000:.1f} ms")
+        return len(entries)
+
+    def get_stats(self) -> Dict:
+        """Get the index size and build time"""
+        return {'phrases': len(self._entries), 'words': len(self._words),
+                'trigrams': len(self._trigrams), 'build_ms': round(self.build_seconds * 1000, 2)}
+
+    def _match_word(self, word: str, prefix: bool) -> Dict[str, int]:
+        """Get the indexed words matching a query word, with their weights"""
+        matches: Dict[str, int] = {}
+        if word in self._postings:
+            matches[word] = EXACT
+
+        if prefix and len(word) >= MIN_PREFIX_LENGTH:
+            # Every word starting with word sorts before word with its last
+            # letter bumped; search() ranks the phrases of all of them
+            start = bisect.bisect_left(self._words, word)
+            end = bisect.bisect_left(self._words, word[:-1] + chr(ord(word[-1]) + 1), start)
+            for candidate in self._words[start:end]:
+                matches.setdefault(candidate, PREFIX)
+
+        if not matches and len(word) >= MIN_FUZZY_LENGTH:
+            # Words sharing enough trigrams, checked by edit distance
+            limit = max_typos(word)
+            grams = trigrams(word)
+            counts: Dict[int, int] = {}
+            for gram in grams:
+                for word_id in self._trigrams.get(gram, ()):
+                    counts[word_id] = counts.get(word_id, 0) + 1
+            # An edit changes at most four trigrams (a swap)
+            needed = max(1, len(grams) - 4 * limit)
+            for word_id, count in counts.items():
+                candidate = self._words[word_id]
+                if count >= needed and candidate not in matches and within_distance(word, candidate, limit):
+                    matches[candidate] = FUZZY
+        return matches
+
+    def search(self, query: str, limit: int = 10) -> List[Dict]:
+        """Find phrases containing every word of the query
+
+        The last query word may be a prefix (as while typing), and words of
+        four letters or more that match nothing as typed may contain typos.
+        Results are ranked by match quality, then field, then phrase length;
+        each has the phrase, field, plan, day number and topic name.
+        """
+        if not self._built:
+            self.build()
+        words = tokenize(query)
+        if not words:
+            return []
+
+        scores: Optional[Dict[int, int]] = None
+        for position, word in enumerate(words):
+            word_scores: Dict[int, int] = {}
+            for match, weight in self._match_word(word, prefix=position == len(words) - 1).items():
+                for entry_id in self._postings[match]:
+                    if word_scores.get(entry_id, 0) < weight:
+                        word_scores[entry_id] = weight
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {entry_id: score + word_scores[entry_id]
+                          for entry_id, score in scores.items() if entry_id in word_scores}
+            if not scores:
+                return []
+
+        phrase = ' '.join(words)
+        # A phrase can appear in several fields of a day, so take enough
+        # candidates to fill limit after dropping the repeats
+        ranked = heapq.nsmallest(
+            limit * len(SEARCH_FIELDS),
+            scores,
+            key=lambda entry_id: (
+                -scores[entry_id] - (EXACT if self._normalized[entry_id] == phrase else 0),
+                SEARCH_FIELDS.index(self._entries[entry_id][1]),
+                len(self._entries[entry_id][0]),
+                entry_id,
+            )
+        )
+
+        results = []
+        seen: Set[Tuple[str, str, int]] = set()
+        for entry_id in ranked:
+            phrase_text, field, plan, day_number, topic = self._entries[entry_id]
+            key = (self._normalized[entry_id], plan, day_number)
+            if key not in seen:
+                seen.add(key)
+                results.append({'phrase': phrase_text, 'field': field, 'plan': plan,
+                                'day': day_number, 'topic': topic})
+                if len(results) == limit:
+                    break
+        return results
+
+
+vocab_index = VocabIndex()
+
+
+def benchmark(copies: int = 1, queries: int = 2000) -> Dict:
+    """Measure index build time and query latency for typical queries"""
+    index = VocabIndex()
+    index.build(copies=copies)
+    samples = ['work-life balance', 'famil', 'enviroment', 'global warm', 'brain drain', 'tecnology',
+               'urban', 'sustainable develop', 'xyzzy', 'healthy lifestyle']
+
+    latencies = []
+    for i in range(queries):
+        started = time.perf_counter()
+        index.search(samples[i % len(samples)])
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return dict(
+        index.get_stats(),
+        queries=queries,
+        p50_ms=round(latencies[len(latencies) // 2], 4),
+        p99_ms=round(latencies[int(len(latencies) * 0.99)], 4),
+        max_ms=round(latencies[-1], 4),
+    )
+
+
+if __name__ == '__main__':
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    copies = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    print(benchmark(copies, queries))
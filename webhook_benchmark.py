@@ -0,0 +1,163 @@
+"""
+Local load test of webhook mode
+Starts the bot's webhook server on localhost with a fake Bot API backend,
+POSTs synthetic checklist button taps to it concurrently and reports the
+tap-to-edit latency: the time from sending an update until the bot edits
+the dashboard message it came from
+
+    python webhook_benchmark.py [updates] [connections] [api_latency_ms] [debounce_s]
+
+Latency includes the debounce window, so pass 0 to see the processing
+cost alone, and the configured window to see what users see.
+"""
+
+import asyncio
+import json
+import logging
+import statistics
+import sys
+import time
+from typing import Dict, Optional, Tuple
+
+from benchmark_support import percentile, use_throwaway_database
+
+use_throwaway_database()
+
+import httpx
+from telegram.request import BaseRequest, RequestData
+
+import callback_codec
+from callback_codec import Action
+from database import local_today
+from main import build_application
+from bot import edit_coalescer
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Benchmark', 'username': 'benchmark_bot'}
+SECRET_TOKEN = 'benchmark-secret'
+
+# One log line per POST would dominate the run
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+
+class FakeBotApi(BaseRequest):
+    """Answers Bot API calls locally after a fixed latency and records edits"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.edited: Dict[Tuple[int, int], float] = {}
+        self.calls: Dict[str, int] = {}
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None,
+                         pool_timeout=None) -> Tuple[int, bytes]:
+        endpoint = url.rsplit('/', 1)[-1]
+        self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+        params = request_data.parameters if request_data else {}
+        await asyncio.sleep(self.latency)
+
+        result = True
+        if endpoint == 'getMe':
+            result = BOT_USER
+        elif endpoint in ('sendMessage', 'editMessageText'):
+            chat_id = int(params['chat_id'])
+            message_id = int(params.get('message_id', 1))
+            if endpoint == 'editMessageText':
+                self.edited.setdefault((chat_id, message_id), time.perf_counter())
+            result = {
+                'message_id': message_id, 'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'group', 'title': 'Benchmark'},
+                'from': BOT_USER, 'text': params.get('text', ''),
+            }
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+
+def make_update(update_id: int, chat_id: int, user_id: int, message_id: int) -> Dict:
+    """A tap on the first participant's first task of a dashboard message"""
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'chat_instance': str(chat_id),
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'User {user_id}'},
+            'data': callback_codec.encode(Action.TOGGLE, member=0, task=0, page=0,
+                                          day=callback_codec.day_to_field(local_today())),
+            'message': {
+                'message_id': message_id, 'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'group', 'title': 'Benchmark'},
+                'from': BOT_USER, 'text': 'dashboard',
+            },
+        },
+    }
+
+
+async def benchmark(updates: int = 1000, connections: int = 40, api_latency: float = 0.05,
+                    debounce: float = 0.0, port: int = 8765) -> Dict:
+    """Serve the webhook locally and POST updates at it from connections clients"""
+    api = FakeBotApi(api_latency)
+    application = build_application('123:benchmark', request=api)
+    edit_coalescer.delay = debounce
+    url = f'http://127.0.0.1:{port}/telegram'
+    sent_at: Dict[Tuple[int, int], float] = {}
+
+    async with application:
+        await application.updater.start_webhook(
+            listen='127.0.0.1', port=port, url_path='telegram',
+            secret_token=SECRET_TOKEN, max_connections=connections
+        )
+        await application.start()
+
+        async with httpx.AsyncClient(limits=httpx.Limits(max_connections=connections)) as client:
+            rejected = await client.post(url, json=make_update(0, -1, 1, 1),
+                                         headers={'X-Telegram-Bot-Api-Secret-Token': 'wrong'})
+            assert rejected.status_code == 403, rejected.status_code
+
+            async def post(i: int):
+                # One chat per ten taps, one user per chat, a message per tap
+                chat_id, message_id = -1000 - i // 10, i + 1
+                sent_at[(chat_id, message_id)] = time.perf_counter()
+                response = await client.post(
+                    url, json=make_update(i + 1, chat_id, 100 + i // 10, message_id),
+                    headers={'X-Telegram-Bot-Api-Secret-Token': SECRET_TOKEN}
+                )
+                response.raise_for_status()
+
+            started = time.perf_counter()
+            await asyncio.gather(*(post(i) for i in range(updates)))
+            posted = time.perf_counter() - started
+
+            deadline = time.perf_counter() + 60 + updates * (api_latency + debounce)
+            while len(api.edited) < updates and time.perf_counter() < deadline:
+                await asyncio.sleep(0.05)
+            seconds = time.perf_counter() - started
+
+        await application.updater.stop()
+        await application.stop()
+
+    latencies = [(api.edited[key] - sent_at[key]) * 1000 for key in api.edited if key in sent_at]
+    return {
+        'updates': updates,
+        'edited': len(latencies),
+        'post_seconds': round(posted, 3),
+        'seconds': round(seconds, 3),
+        'updates_per_second': round(len(latencies) / seconds, 1),
+        'p50_ms': round(percentile(latencies, 0.5), 1) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95), 1) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99), 1) if latencies else None,
+        'mean_ms': round(statistics.mean(latencies), 1) if latencies else None,
+        'api_calls': api.calls,
+        'processing': application.update_processor.get_stats(),
+    }
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    connections = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    latency_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 50
+    debounce = float(sys.argv[4]) if len(sys.argv) > 4 else 0.0
+    print(asyncio.run(benchmark(count, connections, latency_ms / 1000, debounce)))